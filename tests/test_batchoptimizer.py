@@ -0,0 +1,102 @@
+import multiprocessing
+import pandas as pd
+import pytest
+from willitfit.params import CAR_MODEL_NOT_FOUND, INSUFFICIENT_DIMENSION
+from willitfit.app_utils.trunk_dimensions import clear_volume_spaces
+from willitfit.optimizers import resultcache
+from willitfit.optimizers.batchoptimizer import generate_batch, run_tagged_task
+
+CAR_DATA = pd.DataFrame(
+    [
+        {"car_model": "Small", "depth": 40, "extra_depth": 60, "width": 40, "height": 40, "generic_config": "BOXY"},
+        {"car_model": "Large", "depth": 80, "extra_depth": 120, "width": 60, "height": 50, "generic_config": "BOXY"},
+        {"car_model": "Large Twin", "depth": 80, "extra_depth": 120, "width": 60, "height": 50, "generic_config": "BOXY"},
+    ]
+)
+
+ARTICLE_LIST = [
+    ["10000001", 2, [(1, 50, 30, 10, 5.0)]],
+    ["10000002", 1, [(1, 20, 20, 15, 1.5)]],
+]
+
+
+def test_batch_prunes_infeasible_cars():
+    clear_volume_spaces()
+    with multiprocessing.Pool(2) as worker_pool:
+        table = generate_batch(
+            ARTICLE_LIST,
+            CAR_DATA,
+            ["Small", "Large", "Unknown", "Large Twin"],
+            worker_pool=worker_pool,
+            result_cache=False,
+        )
+    clear_volume_spaces()
+    assert table["car_model"].tolist() == ["Small", "Large", "Unknown", "Large Twin"]
+    assert table["fits"].tolist() == [False, True, False, True]
+    assert table.loc[0, "message"] == INSUFFICIENT_DIMENSION
+    assert table.loc[2, "message"] == CAR_MODEL_NOT_FOUND
+    assert table["message"].isna().tolist() == [False, True, False, True]
+    assert table.loc[1, ["depth", "width", "height"]].tolist() == [80, 60, 50]
+    # Identical trunks share one solution
+    assert table.loc[1, "package_coordinates"] is table.loc[3, "package_coordinates"]
+    assert len(table.loc[1, "package_coordinates"]) == 3
+
+
+def test_batch_submits_all_trunks_at_once():
+    clear_volume_spaces()
+    # Small trunk with extra depth now fits as well
+    car_data = CAR_DATA.assign(width=[60, 60, 60])
+    with multiprocessing.Pool(2) as worker_pool:
+        task_functions = []
+        imap_unordered = worker_pool.imap_unordered
+
+        def record_imap_unordered(task_function, tasks):
+            task_functions.append(task_function)
+            return imap_unordered(task_function, tasks)
+
+        worker_pool.imap_unordered = record_imap_unordered
+        table = generate_batch(
+            ARTICLE_LIST,
+            car_data,
+            ["Small", "Large"],
+            extra_depth=True,
+            worker_pool=worker_pool,
+            result_cache=False,
+            improve_time=None,
+        )
+    clear_volume_spaces()
+    assert table["fits"].tolist() == [True, True]
+    # Tasks of both trunks go through one stream
+    assert task_functions == [run_tagged_task]
+
+
+def test_batch_uses_default_result_cache(monkeypatch):
+    clear_volume_spaces()
+    # Fresh shared cache, so that earlier tests do not matter
+    monkeypatch.setattr(resultcache, "_RESULT_CACHE", None)
+    with multiprocessing.Pool(2) as worker_pool:
+        table = generate_batch(ARTICLE_LIST, CAR_DATA, ["Large"], worker_pool=worker_pool, improve_time=None)
+        submitted_tasks = []
+        imap_unordered = worker_pool.imap_unordered
+
+        def record_imap_unordered(task_function, tasks):
+            submitted_tasks.extend(tasks)
+            return imap_unordered(task_function, submitted_tasks)
+
+        worker_pool.imap_unordered = record_imap_unordered
+        cached_table = generate_batch(ARTICLE_LIST, CAR_DATA, ["Large"], worker_pool=worker_pool, improve_time=None)
+    clear_volume_spaces()
+    assert table["fits"].tolist() == cached_table["fits"].tolist() == [True]
+    # Identical packages may swap places in the cache
+    assert sorted(coordinates[3:] for coordinates in cached_table.loc[0, "package_coordinates"]) == sorted(
+        coordinates[3:] for coordinates in table.loc[0, "package_coordinates"]
+    )
+    # Cached trunks do not reach the worker pool
+    assert submitted_tasks == []
+
+
+def test_batch_rejects_unsupported_settings():
+    with pytest.raises(TypeError):
+        generate_batch(ARTICLE_LIST, CAR_DATA, ["Large"], resolution=5)
+    with pytest.raises(TypeError):
+        generate_batch(ARTICLE_LIST, CAR_DATA, ["Large"], time_buget=1.0)
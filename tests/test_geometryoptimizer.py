@@ -0,0 +1,93 @@
+import multiprocessing
+import numpy as np
+from willitfit.params import VOL_EMPTY, VOL_UNAVAILABLE, VOL_DTYPE
+from willitfit.optimizers.volumeoptimizer import generate_optimizer, sort_packages, start_optimizer_tasks
+from willitfit.optimizers.geometryoptimizer import (
+    BoxSpace,
+    find_unavailable_boxes,
+    geometry_optimizer,
+)
+
+ARTICLE_LIST = [
+    ["10000001", 2, [(1, 20, 30, 10, 5.0)]],
+    ["10000002", 1, [(1, 40, 10, 10, 2.0), (2, 15, 15, 15, 1.5)]],
+]
+
+
+def get_test_space():
+    # Slanted like a trunk, with a few unavailable cells on the floor
+    volume_space = np.full((60, 50, 40), VOL_EMPTY, dtype=VOL_DTYPE)
+    for i in range(10):
+        volume_space[-(i + 1), :, 30 - i :] = VOL_UNAVAILABLE
+    volume_space[30:35, 45:, :3] = VOL_UNAVAILABLE
+    return volume_space
+
+
+def check_placements(volume_space, package_coordinates):
+    occupied = np.zeros(volume_space.shape, dtype=int)
+    for coordinates in package_coordinates:
+        x1, y1, z1, x2, y2, z2 = coordinates[3:]
+        occupied[x1 : x2 + 1, y1 : y2 + 1, z1 : z2 + 1] += 1
+    assert occupied.max() == 1
+    assert not np.any(occupied[volume_space == VOL_UNAVAILABLE])
+
+
+def test_unavailable_boxes_cover_exactly_the_unavailable_space():
+    volume_space = get_test_space()
+    boxes = find_unavailable_boxes(volume_space)
+    covered = np.zeros(volume_space.shape, dtype=int)
+    for x1, y1, z1, x2, y2, z2 in boxes:
+        covered[x1:x2, y1:y2, z1:z2] += 1
+    assert covered.max() == 1
+    assert np.array_equal(covered == 1, volume_space != VOL_EMPTY)
+    # One box per slant step and one for the floor obstacle
+    assert len(boxes) == 11
+
+
+def test_box_space_undoes_placements():
+    box_space = BoxSpace((60, 50, 40), find_unavailable_boxes(get_test_space()))
+    box_space.add_package(0, 0, 0, 20, 30, 10)
+    assert sorted(box_space.extreme_points) == [(0, 0, 10), (0, 30, 0), (20, 0, 0)]
+    assert box_space.collides(np.array([[10, 10, 5], [0, 30, 0]]), np.array([[1, 1, 1], [5, 5, 5]])).tolist() == [True, False]
+    assert box_space.remove_package() == (0, 0, 0, 20, 30, 10)
+    assert box_space.extreme_points == [(0, 0, 0)]
+
+
+def test_geometry_engine_places_all_packages():
+    volume_space = get_test_space()
+    package_list = sort_packages(ARTICLE_LIST)
+    score, attempts, package_coordinates = geometry_optimizer(
+        package_list,
+        ARTICLE_LIST,
+        volume_space.shape,
+        find_unavailable_boxes(volume_space),
+        placement_rule="lowest_z",
+    )
+    assert len(package_coordinates) == 4
+    check_placements(volume_space, package_coordinates)
+    with multiprocessing.Pool(2) as worker_pool:
+        filled_space, package_coordinates = generate_optimizer(
+            ARTICLE_LIST, volume_space, worker_pool=worker_pool, engine="geometry", result_cache=False
+        )
+    assert len(package_coordinates) == 4
+    check_placements(volume_space, package_coordinates)
+    assert np.count_nonzero(filled_space != volume_space) == 2 * 6000 + 4000 + 3375
+
+
+def test_geometry_tasks_only_share_the_cancellation_flag():
+    volume_space = get_test_space()
+    shared_block, cancel_flag, _, tasks = start_optimizer_tasks(
+        ARTICLE_LIST, volume_space, None, np.random.SeedSequence(0), engine="geometry"
+    )
+    try:
+        # Trunk is passed as boxes, not copied into shared memory
+        assert shared_block.size < volume_space.nbytes
+        _, trunk_dims, obstacles = next(tasks)[2]
+        assert trunk_dims == volume_space.shape
+        assert np.array_equal(obstacles, find_unavailable_boxes(volume_space))
+        assert not cancel_flag.is_set()
+        cancel_flag.set()
+        assert cancel_flag.is_set()
+    finally:
+        shared_block.close()
+        shared_block.unlink()
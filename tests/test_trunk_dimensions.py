@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+from willitfit.params import VOL_EMPTY, VOL_UNAVAILABLE, TRUNK_PROFILES
+from willitfit.app_utils import trunk_dimensions
+from willitfit.app_utils.trunk_dimensions import (
+    build_trunk_boxes,
+    build_volume_space,
+    get_volume_space,
+    preload_volume_spaces,
+    clear_volume_spaces,
+)
+
+CAR_DATA = pd.DataFrame(
+    [
+        {"car_model": "Test 1.0", "depth": 100, "extra_depth": 160, "width": 100, "height": 80, "generic_config": "SLANT"},
+        {"car_model": "Box/Van", "depth": 120, "extra_depth": 180, "width": 110, "height": 90, "generic_config": "BOXY"},
+    ]
+)
+
+
+def test_volume_space_templates_are_cached(tmp_path, monkeypatch):
+    clear_volume_spaces()
+    volume_space, trunk_dims = get_volume_space(CAR_DATA, "Test 1.0", folder=str(tmp_path))
+    assert trunk_dims.tolist() == [100, 100, 80]
+    # Slant starts at half the height and rises two cells per row
+    assert volume_space[-1, 0, 39] == VOL_EMPTY and volume_space[-1, 0, 40] == VOL_UNAVAILABLE
+    assert volume_space[-2, 0, 41] == VOL_EMPTY and volume_space[-2, 0, 42] == VOL_UNAVAILABLE
+    assert not volume_space.flags.writeable
+    # Same template is returned for the same trunk
+    assert get_volume_space(CAR_DATA, "Test 1.0")[0] is volume_space
+    extra_space, extra_dims = get_volume_space(CAR_DATA, "Test 1.0", extra_depth=True)
+    assert extra_dims.tolist() == [160, 100, 80]
+    # A changed car database gets a new template
+    changed_data = CAR_DATA.assign(height=[70, 90])
+    assert get_volume_space(changed_data, "Test 1.0")[1].tolist() == [100, 100, 70]
+    # Only the most recently used templates are kept in memory
+    monkeypatch.setattr(trunk_dimensions, "TRUNK_TEMPLATE_CACHE_SIZE", 2)
+    get_volume_space(CAR_DATA, "Test 1.0")
+    assert len(trunk_dimensions._VOLUME_SPACES) == 2
+    assert get_volume_space(CAR_DATA, "Test 1.0", extra_depth=True)[0] is not extra_space
+    # Saved templates are memory-mapped after a restart
+    get_volume_space(CAR_DATA, "Box/Van", folder=str(tmp_path))
+    clear_volume_spaces()
+    assert preload_volume_spaces(str(tmp_path)) == 2
+    loaded_space, _ = get_volume_space(CAR_DATA, "Box/Van")
+    assert isinstance(loaded_space, np.memmap)
+    assert loaded_space[-1, 0, 61] == VOL_EMPTY and loaded_space[-1, 0, 62] == VOL_UNAVAILABLE
+    clear_volume_spaces()
+
+
+def test_trunk_shape_matches_its_boxes():
+    trunk_dims = np.array([100, 100, 80])
+    profile = {"ratio_height": 0.5, "slant": 2, "wheel_arches": [(0.2, 0.5, 0.1, 0.25)], "floor_steps": [(0.9, 1, 0.1)]}
+    boxes = build_trunk_boxes(trunk_dims, profile)
+    TRUNK_PROFILES["TEST"] = profile
+    try:
+        volume_space, grid_boxes = build_volume_space(trunk_dims, "TEST")
+    finally:
+        del TRUNK_PROFILES["TEST"]
+    assert np.array_equal(boxes, grid_boxes)
+    covered = np.zeros(volume_space.shape, dtype=bool)
+    for x1, y1, z1, x2, y2, z2 in boxes:
+        covered[x1:x2, y1:y2, z1:z2] = True
+    assert np.array_equal(covered, volume_space == VOL_UNAVAILABLE)
+    # Wheel arches on both sides, a raised floor at the rear
+    assert volume_space[30, 5, 10] == VOL_UNAVAILABLE and volume_space[30, 95, 10] == VOL_UNAVAILABLE
+    assert volume_space[30, 50, 10] == VOL_EMPTY
+    assert volume_space[95, 50, 7] == VOL_UNAVAILABLE and volume_space[85, 50, 7] == VOL_EMPTY
@@ -0,0 +1,19 @@
+from willitfit.params import ARTICLE_NOT_FOUND
+from willitfit.app_utils.utils import find_local_articles
+
+ARTICLE_DATABASE = """width,height,length,weight,packages,subarticle_code,article_code,product_name
+30,10,50,5.0,1,90309762,90309762,BILLY
+20,15,20,1.5,2,20409163,20409163,LACK
+"""
+
+
+def test_find_local_articles(tmp_path):
+    path_to_csv = tmp_path / "ikea_database.csv"
+    path_to_csv.write_text(ARTICLE_DATABASE)
+    article_list, product_names = find_local_articles({"90309762": 2, "20409163": 1}, path_to_csv=path_to_csv)
+    assert article_list == [
+        ["90309762", 2, [(1, 10, 30, 50, 5.0)]],
+        ["20409163", 1, [(1, 15, 20, 20, 1.5), (2, 15, 20, 20, 1.5)]],
+    ]
+    assert product_names.loc["20409163", "product_name"] == "LACK"
+    assert find_local_articles({"10000001": 1}, path_to_csv=path_to_csv) == ARTICLE_NOT_FOUND
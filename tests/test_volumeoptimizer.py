@@ -0,0 +1,415 @@
+import multiprocessing
+import numpy as np
+import pytest
+import time
+from willitfit.params import (
+    INSUFFICIENT_DIMENSION,
+    INSUFFICIENT_SPACE,
+    VOL_EMPTY,
+    VOL_UNAVAILABLE,
+    VOL_DTYPE,
+    OPT_INSUFFICIENT_SPACE,
+    OPT_TIME_BUDGET_EXCEEDED,
+    OPT_UNSUCCESSFUL,
+)
+from willitfit.optimizers.volumeoptimizer import (
+    SpaceIndex,
+    find_first_space,
+    place_package,
+    get_orientations,
+    unplace_package,
+    optimizer,
+    generate_optimizer,
+    fill_space,
+    find_empty_space,
+    find_open_surfaces,
+    score_space,
+    SpaceScorer,
+    sort_packages,
+    build_package_table,
+    iter_package_lists,
+    log_unique_orderings,
+    stack_packages,
+    get_solution,
+    improve_solution,
+    TrunkProfile,
+    find_longest_space_dimension,
+)
+from willitfit.optimizers import volumeoptimizer
+from willitfit.optimizers.resultcache import ResultCache
+
+ARTICLE_LIST = [
+    ["10000001", 2, [(1, 20, 30, 10, 5.0)]],
+    ["10000002", 1, [(1, 40, 10, 10, 2.0), (2, 15, 15, 15, 1.5)]],
+]
+
+
+def get_test_space():
+    volume_space = np.full((60, 50, 40), VOL_EMPTY, dtype=VOL_DTYPE)
+    volume_space[-10:, :, 30:] = VOL_UNAVAILABLE
+    return volume_space
+
+
+def test_space_index_tracks_extreme_points():
+    volume_space = get_test_space()
+    space_index = SpaceIndex(volume_space)
+    placement = place_package((20, 30, 10), volume_space, space_index=space_index)
+    assert placement[1:4] == (0, 0, 0)
+    assert sorted(space_index.extreme_points) == [(0, 0, 10), (0, 30, 0), (20, 0, 0)]
+    assert find_first_space(20, 30, 10, volume_space, space_index) == (20, 0, 0)
+    assert find_first_space(70, 1, 1, volume_space, space_index) == OPT_INSUFFICIENT_SPACE
+
+
+def test_sort_packages_returns_package_table():
+    package_list = sort_packages(ARTICLE_LIST)
+    assert package_list["article"].tolist() == [0, 0, 1, 1]
+    assert package_list["instance"].tolist() == [2, 1, 1, 1]
+    assert package_list["package"].tolist() == [1, 1, 1, 2]
+    assert package_list[3][["length", "width", "height"]].tolist() == (15, 15, 15)
+    # Identical dimensions in any orientation share a group
+    package_table = build_package_table(ARTICLE_LIST + [["10000003", 1, [(1, 30, 10, 20, 1.0)]]])
+    assert package_table["group"].tolist() == [0, 0, 1, 2, 0]
+
+
+def test_registered_sorters_order_packages():
+    # Volumes 6000, 6000, 4000, 3375, longest edges 30, 30, 40, 15, weights 5, 5, 2, 1.5
+    assert sort_packages(ARTICLE_LIST, "longest_edge")["package"].tolist() == [1, 1, 1, 2]
+    assert sort_packages(ARTICLE_LIST, "longest_edge")["article"].tolist() == [1, 0, 0, 1]
+    assert sort_packages(ARTICLE_LIST, "weight", "ascending")["weight"].tolist() == [1.5, 2, 5, 5]
+    assert sort_packages(ARTICLE_LIST, "footprint")["article"].tolist() == [0, 0, 1, 1]
+    assert sort_packages(ARTICLE_LIST, "density")["article"].tolist() == [0, 0, 1, 1]
+    # Heights when placed flat are 10, 10, 10, 15, whichever dimension comes last
+    assert sort_packages(ARTICLE_LIST, "height")["package"].tolist()[0] == 2
+    article_list = [["10000003", 1, [(1, 5, 10, 40, 1.0)]]] + ARTICLE_LIST
+    assert sort_packages(article_list, "height", "ascending")["article"][0] == 0
+    with pytest.raises(ValueError):
+        sort_packages(ARTICLE_LIST, "colour")
+
+
+def test_package_lists_are_unique_and_bounded():
+    # Three identical packages and one other only have four distinct orderings
+    article_list = [["10000001", 3, [(1, 20, 30, 10, 5.0)]], ["10000002", 1, [(1, 15, 15, 15, 1.5)]]]
+    assert np.isclose(np.exp(log_unique_orderings(build_package_table(article_list))), 4)
+    package_lists = list(
+        iter_package_lists(
+            article_list, random_lists=10, rng=np.random.default_rng(0), group_packages=False
+        )
+    )
+    assert sorted(package_list["article"].tolist() for package_list in package_lists) == [
+        [0, 0, 0, 1], [0, 0, 1, 0], [0, 1, 0, 0], [1, 0, 0, 0]
+    ]
+    # Grouped, identical packages stay together
+    package_lists = list(iter_package_lists(article_list, random_lists=10, rng=np.random.default_rng(0)))
+    assert sorted(package_list["group"].tolist() for package_list in package_lists) == [
+        [0, 0, 0, 1], [1, 0, 0, 0]
+    ]
+    # Bound stays finite for large orders
+    bulk_list = [["10000001", 500, [(1, 1, 1, 1, 1.0)]], ["10000002", 500, [(1, 2, 2, 2, 1.0)]]]
+    assert np.isfinite(log_unique_orderings(build_package_table(bulk_list)))
+
+
+def test_optimizer_places_all_packages():
+    package_list = sort_packages(ARTICLE_LIST)
+    volume_space = get_test_space()
+    result = optimizer(package_list, ARTICLE_LIST, np.copy(volume_space), np.copy(volume_space))
+    score, attempts, filled_space, package_coordinates = result
+    assert [c[:3] for c in package_coordinates] == [
+        ["10000001", 2, 1], ["10000001", 1, 1], ["10000002", 1, 1], ["10000002", 1, 2]
+    ]
+    # Packages never overlap each other or unavailable space
+    occupied = np.zeros(filled_space.shape, dtype=int)
+    for coordinates in package_coordinates:
+        x1, y1, z1, x2, y2, z2 = coordinates[3:]
+        occupied[x1 : x2 + 1, y1 : y2 + 1, z1 : z2 + 1] += 1
+    assert occupied.max() == 1
+    assert not np.any(occupied[volume_space == VOL_UNAVAILABLE])
+    # Scorer gives the same result as scoring from scratch
+    assert score == score_space(filled_space, ARTICLE_LIST)
+    # Filled space can be rebuilt from coordinates alone
+    assert np.array_equal(fill_space(np.copy(volume_space), package_coordinates), filled_space)
+
+
+def test_find_empty_space_returns_largest_pocket():
+    # Wall at x = 25 splits the space into two pockets
+    volume_space = np.full((30, 10, 10), VOL_EMPTY, dtype=VOL_DTYPE)
+    volume_space[25] = VOL_UNAVAILABLE
+    assert find_empty_space(volume_space) == (2, 2900, 2500)
+
+
+def test_identical_packages_are_placed_as_layers(monkeypatch):
+    calls = {"add_layer": 0, "find_best_space": 0}
+    for name in calls:
+
+        def count_calls(self, *args, name=name, method=getattr(SpaceIndex, name), **kwargs):
+            calls[name] += 1
+            return method(self, *args, **kwargs)
+
+        monkeypatch.setattr(SpaceIndex, name, count_calls)
+    article_list = [["10000001", 6, [(1, 20, 25, 5, 1.0)]]]
+    _, space_index, package_coordinates = stack_packages(
+        sort_packages(article_list),
+        article_list,
+        lambda: SpaceIndex(get_test_space()),
+        bias_tendency=1,
+        rng=np.random.default_rng(0),
+        layer_min_packages=4,
+    )
+    # Six packages fit flat on the floor in a single 3 x 2 layer
+    assert calls == {"add_layer": 1, "find_best_space": 0}
+    assert len(package_coordinates) == 6 and len(space_index.undo_log) == 6
+    assert all(c[5] == 0 and c[8] == 4 for c in package_coordinates)
+    # Layer matches filling packages one at a time
+    rebuilt = fill_space(get_test_space(), package_coordinates)
+    assert np.array_equal(space_index.occupied_sum, SpaceIndex(rebuilt).occupied_sum)
+    # Packages can be removed one by one
+    space_index.remove_package()
+    rebuilt = fill_space(get_test_space(), package_coordinates[:-1])
+    assert np.array_equal(space_index.occupied_sum, SpaceIndex(rebuilt).occupied_sum)
+    # Bulk order places all packages without overlaps
+    article_list = [["10000001", 12, [(1, 20, 25, 5, 1.0)]], ["10000002", 1, [(1, 15, 15, 15, 1.5)]]]
+    result = optimizer(sort_packages(article_list), article_list, get_test_space(), get_test_space())
+    assert len(result[3]) == 13
+    assert np.array_equal(fill_space(get_test_space(), result[3]), result[2])
+    # Layers follow the bias, flat packs stay flat even though more would fit on edge
+    article_list = [["10000001", 12, [(1, 40, 30, 5, 1.0)]]]
+    volume_space = np.full((100, 35, 50), VOL_EMPTY, dtype=VOL_DTYPE)
+    result = optimizer(
+        sort_packages(article_list),
+        article_list,
+        np.copy(volume_space),
+        np.copy(volume_space),
+        bias_tendency=1,
+        rng=np.random.default_rng(0),
+    )
+    assert len(result[3]) == 12
+    assert all(c[8] - c[5] + 1 == 5 for c in result[3])
+
+
+def test_space_index_summed_area_table_stays_exact():
+    volume_space = get_test_space()
+    space_index = SpaceIndex(volume_space)
+    place_package((20, 30, 10), volume_space, space_index=space_index)
+    place_package((15, 15, 15), volume_space, space_index=space_index)
+    # Incrementally updated table matches a freshly built one
+    assert np.array_equal(space_index.occupied_sum, SpaceIndex(volume_space).occupied_sum)
+    # Box sums match brute force occupancy counts
+    box_sums = space_index.box_sums(5, 7, 3)
+    occupied = volume_space != VOL_EMPTY
+    assert box_sums[18, 28, 8] == np.count_nonzero(occupied[18:23, 28:35, 8:11])
+    assert box_sums.shape == (56, 44, 38)
+    assert space_index.surfaces == find_open_surfaces(volume_space)
+    # Undoing the last placement restores the previous state exactly
+    unplace_package(volume_space, space_index)
+    assert np.array_equal(space_index.occupied_sum, SpaceIndex(volume_space).occupied_sum)
+    assert sorted(space_index.extreme_points) == [(0, 0, 10), (0, 30, 0), (20, 0, 0)]
+    assert space_index.surfaces == find_open_surfaces(volume_space)
+    assert np.count_nonzero(volume_space != get_test_space()) == 20 * 30 * 10
+
+
+def test_optimizer_backtracks_before_starting_over(monkeypatch):
+    # Lying flat, the second package is 20 long and cannot fit into 19
+    article_list = [["10000001", 1, [(1, 17, 8, 10, 1.0)]], ["10000002", 1, [(1, 20, 9, 7, 1.0)]]]
+    volume_space = np.full((19, 29, 18), VOL_EMPTY, dtype=VOL_DTYPE)
+    package_list = sort_packages(article_list)
+    calls = {"remove_package": 0, "__init__": 0}
+    for name in calls:
+        method = getattr(SpaceIndex, name)
+
+        def counted(self, *args, name=name, method=method):
+            calls[name] += 1
+            return method(self, *args)
+
+        monkeypatch.setattr(SpaceIndex, name, counted)
+
+    def run_optimizer(backtrack_depth):
+        for name in calls:
+            calls[name] = 0
+        return optimizer(
+            package_list,
+            article_list,
+            np.copy(volume_space),
+            np.copy(volume_space),
+            max_attempts=2,
+            bias_tendency=1,
+            backtrack_depth=backtrack_depth,
+            rng=np.random.default_rng(0),
+            layer_min_packages=0,
+        )
+
+    # Undoing the first package and placing both in other orientations recovers without starting over
+    score, attempts, filled_space, package_coordinates = run_optimizer(1)
+    assert attempts == 2 and len(package_coordinates) == 2
+    assert calls == {"remove_package": 1, "__init__": 1}
+    occupied = np.zeros(volume_space.shape, dtype=int)
+    for coordinates in package_coordinates:
+        x1, y1, z1, x2, y2, z2 = coordinates[3:]
+        occupied[x1 : x2 + 1, y1 : y2 + 1, z1 : z2 + 1] += 1
+    assert occupied.max() == 1
+    assert np.array_equal(fill_space(np.copy(volume_space), package_coordinates), filled_space)
+    # Without backtracking every failure starts over, lying flat again
+    assert run_optimizer(0) == OPT_UNSUCCESSFUL
+    assert calls == {"remove_package": 0, "__init__": 2}
+
+
+def test_generate_optimizer_uses_given_worker_pool():
+    volume_space = get_test_space()
+    with multiprocessing.Pool(2) as worker_pool:
+        result = generate_optimizer(
+            ARTICLE_LIST, volume_space, generator_random_lists=1, worker_pool=worker_pool
+        )
+    filled_space, package_coordinates = result
+    assert len(package_coordinates) == 4
+    assert filled_space.shape == volume_space.shape
+
+
+def test_generate_optimizer_respects_time_budget():
+    volume_space = get_test_space()
+    with multiprocessing.Pool(2) as worker_pool:
+        result = generate_optimizer(
+            ARTICLE_LIST, volume_space, worker_pool=worker_pool, time_budget=0
+        )
+        assert result == OPT_TIME_BUDGET_EXCEEDED
+        # Pool is still usable afterwards
+        result = generate_optimizer(
+            ARTICLE_LIST, volume_space, worker_pool=worker_pool, target_score=np.inf
+        )
+    assert len(result[1]) == 4
+
+
+def test_place_package_evaluates_all_orientations():
+    assert len(get_orientations(20, 30, 10)) == 6
+    assert len(get_orientations(20, 20, 20)) == 1
+    assert get_orientations(20, 30, 10)[0] == (30, 20, 10)
+    # Only fits upright next to unavailable space
+    volume_space = np.full((30, 30, 40), VOL_UNAVAILABLE, dtype=VOL_DTYPE)
+    volume_space[:10, :10, :] = VOL_EMPTY
+    placement = place_package((35, 5, 8), volume_space, placement_rule="lowest_z")
+    assert placement[1:] == (0, 0, 0, 7, 4, 34) or placement[1:] == (0, 0, 0, 4, 7, 34)
+
+
+def test_generate_optimizer_is_reproducible_with_seed():
+    volume_space = get_test_space()
+    with multiprocessing.Pool(2) as worker_pool:
+        results = [
+            generate_optimizer(
+                ARTICLE_LIST,
+                volume_space,
+                generator_random_lists=2,
+                worker_pool=worker_pool,
+                seed=42,
+                result_cache=False,
+            )
+            for _ in range(2)
+        ]
+    assert results[0][1] == results[1][1]
+    assert np.array_equal(results[0][0], results[1][0])
+
+
+def test_generate_optimizer_returns_cached_result(tmp_path):
+    volume_space = get_test_space()
+    result_cache = ResultCache(max_size=1, folder=str(tmp_path))
+    with multiprocessing.Pool(2) as worker_pool:
+        filled_space, package_coordinates = generate_optimizer(
+            ARTICLE_LIST, volume_space, worker_pool=worker_pool, result_cache=result_cache
+        )
+    # Same package dimensions under different article codes, served from disk without a pool
+    renamed_list = [["20000001", 2, ARTICLE_LIST[0][2]], ["20000002", 1, ARTICLE_LIST[1][2]]]
+    result_cache.clear()
+    cached_space, cached_coordinates = generate_optimizer(
+        renamed_list, volume_space, worker_pool=False, result_cache=result_cache
+    )
+    assert np.array_equal(cached_space, filled_space)
+    assert [c[3:] for c in cached_coordinates] == [c[3:] for c in package_coordinates]
+    assert {c[0] for c in cached_coordinates} == {"20000001", "20000002"}
+
+
+def test_generate_optimizer_refines_coarse_solution():
+    volume_space = get_test_space()
+    with multiprocessing.Pool(2) as worker_pool:
+        filled_space, package_coordinates = generate_optimizer(
+            ARTICLE_LIST, volume_space, worker_pool=worker_pool, resolution=3, result_cache=False
+        )
+    occupied = np.zeros(volume_space.shape, dtype=int)
+    dimensions = []
+    for coordinates in package_coordinates:
+        x1, y1, z1, x2, y2, z2 = coordinates[3:]
+        occupied[x1 : x2 + 1, y1 : y2 + 1, z1 : z2 + 1] += 1
+        dimensions.append(sorted([x2 - x1 + 1, y2 - y1 + 1, z2 - z1 + 1]))
+    assert occupied.max() == 1
+    assert not np.any(occupied[volume_space == VOL_UNAVAILABLE])
+    # Packages keep their actual dimensions at full resolution
+    assert sorted(dimensions) == [[10, 10, 40], [10, 20, 30], [10, 20, 30], [15, 15, 15]]
+    # Refined packages rest on the floor or on something else
+    for coordinates in package_coordinates:
+        x1, y1, z1, x2, y2, z2 = coordinates[3:]
+        assert z1 == 0 or np.any(filled_space[x1 : x2 + 1, y1 : y2 + 1, z1 - 1] != VOL_EMPTY)
+
+
+def test_improvement_keeps_stacking_valid():
+    volume_space = get_test_space()
+    score, _, filled_space, package_coordinates = optimizer(
+        sort_packages(ARTICLE_LIST), ARTICLE_LIST, np.copy(volume_space), np.copy(volume_space)
+    )
+    package_list, orientations = get_solution(package_coordinates, ARTICLE_LIST)
+    assert sorted(orientations[0]) == [10, 20, 30]
+    improved_score, improved_coordinates = improve_solution(
+        package_list, orientations, ARTICLE_LIST, volume_space, 0.2, rng=np.random.default_rng(0)
+    )
+    assert improved_score <= score_space(fill_space(np.copy(volume_space), package_coordinates), ARTICLE_LIST)
+    assert improved_score == score_space(fill_space(np.copy(volume_space), improved_coordinates), ARTICLE_LIST)
+    assert sorted(c[:3] for c in improved_coordinates) == sorted(c[:3] for c in package_coordinates)
+    with multiprocessing.Pool(2) as worker_pool:
+        filled_space, package_coordinates = generate_optimizer(
+            ARTICLE_LIST, volume_space, worker_pool=worker_pool, improve_time=0.2, result_cache=False
+        )
+    occupied = np.zeros(volume_space.shape, dtype=int)
+    for coordinates in package_coordinates:
+        x1, y1, z1, x2, y2, z2 = coordinates[3:]
+        occupied[x1 : x2 + 1, y1 : y2 + 1, z1 : z2 + 1] += 1
+    assert occupied.max() == 1
+    assert not np.any(occupied[volume_space == VOL_UNAVAILABLE])
+    # Improvement stops at the deadline, even when its tasks have to wait for a worker
+    assert improve_solution(
+        package_list, orientations, ARTICLE_LIST, volume_space, 0.2, deadline=time.time() - 1
+    ) == OPT_TIME_BUDGET_EXCEEDED
+    with multiprocessing.Pool(1) as worker_pool:
+        improvement_tasks = []
+        imap_unordered = worker_pool.imap_unordered
+
+        def record_imap_unordered(task_function, tasks):
+            if task_function is volumeoptimizer.run_improvement_task:
+                tasks = list(tasks)
+                improvement_tasks.extend(tasks)
+            return imap_unordered(task_function, tasks)
+
+        worker_pool.imap_unordered = record_imap_unordered
+        begin_time = time.time()
+        generate_optimizer(
+            ARTICLE_LIST,
+            volume_space,
+            worker_pool=worker_pool,
+            worker_count=4,
+            time_budget=1.0,
+            improve_time=0.5,
+            result_cache=False,
+        )
+    # One run per worker, all sharing a deadline within the improvement time and the time budget
+    assert len(improvement_tasks) == 4
+    assert len({task[5] for task in improvement_tasks}) == 1
+    assert improvement_tasks[0][5] <= begin_time + 1.0
+    assert improvement_tasks[0][4] <= 0.5
+
+
+def test_trunk_profile_rejects_packages_that_cannot_fit():
+    volume_space = get_test_space()
+    trunk_profile = TrunkProfile(volume_space)
+    assert trunk_profile.free_volume == 60 * 50 * 40 - 10 * 50 * 10
+    assert trunk_profile.max_runs == (60, 50, 40) == (find_longest_space_dimension(volume_space), 50, 40)
+    assert trunk_profile.slice_height.tolist() == [40] * 50 + [30] * 10
+    # Fits by volume and longest dimension, but is too high for the rear of the trunk
+    assert not trunk_profile.fits_package(55, 45, 35)
+    assert trunk_profile.fits_package(55, 45, 30)
+    tall_list = [["10000003", 1, [(1, 55, 45, 35, 1.0)]]]
+    assert generate_optimizer(tall_list, volume_space, worker_pool=False) == INSUFFICIENT_DIMENSION
+    bulk_list = [["10000003", 20, [(1, 30, 30, 30, 1.0)]]]
+    assert generate_optimizer(bulk_list, volume_space, worker_pool=False) == INSUFFICIENT_SPACE
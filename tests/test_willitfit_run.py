@@ -0,0 +1,84 @@
+from importlib.machinery import SourceFileLoader
+from importlib.util import module_from_spec, spec_from_loader
+import json
+from pathlib import Path
+import sys
+import types
+import pytest
+from willitfit.params import ARTICLE_NOT_FOUND, CAR_MODEL_NOT_FOUND
+from willitfit.optimizers import geometryoptimizer
+
+# Script has no .py suffix, so it is loaded from its path
+loader = SourceFileLoader("willitfit_run", str(Path(__file__).parents[1] / "scripts" / "willitfit-run"))
+willitfit_run = module_from_spec(spec_from_loader(loader.name, loader))
+loader.exec_module(willitfit_run)
+
+CAR_DATABASE = """make,car_model,depth,extra_depth,width,height,generic_config
+Test,Test Car,100,160,100,80,SLANT
+"""
+
+ARTICLE_DATABASE = """width,height,length,weight,packages,subarticle_code,article_code,product_name
+30,10,50,5.0,1,90309762,90309762,BILLY
+20,15,20,1.5,2,20409163,20409163,LACK
+"""
+
+PDF_TEXT = """903.097.62
+2 St.
+204.091.63
+1 St.
+"""
+
+
+@pytest.fixture
+def databases(tmp_path):
+    car_database = tmp_path / "cars.csv"
+    car_database.write_text(CAR_DATABASE)
+    article_database = tmp_path / "ikea.csv"
+    article_database.write_text(ARTICLE_DATABASE)
+    return ["--car-database", str(car_database), "--article-database", str(article_database)]
+
+
+@pytest.fixture
+def pdfminer(monkeypatch):
+    # pdfminer only reads the text of the PDF, so parsing runs on fixed text instead
+    high_level = types.ModuleType("pdfminer.high_level")
+    high_level.extract_text = lambda uploaded_pdf, laparams: PDF_TEXT
+    layout = types.ModuleType("pdfminer.layout")
+    layout.LAParams = dict
+    monkeypatch.setitem(sys.modules, "pdfminer", types.ModuleType("pdfminer"))
+    monkeypatch.setitem(sys.modules, "pdfminer.high_level", high_level)
+    monkeypatch.setitem(sys.modules, "pdfminer.layout", layout)
+    monkeypatch.delitem(sys.modules, "willitfit.app_utils.pdf_parser", raising=False)
+
+
+@pytest.mark.parametrize(
+    "articles",
+    [["--articles", "903.097.62 (2), 204.091.63"], ["--pdf", "wishlist.pdf"]],
+)
+def test_main(databases, pdfminer, tmp_path, articles):
+    output = tmp_path / "result.json"
+    args = ["Test Car", *articles, *databases, "--improve-time", "0", "--output", str(output)]
+    assert willitfit_run.main(args) == 0
+    result = json.loads(output.read_text())
+    assert result["fits"]
+    assert result["error"] is None
+    assert result["articles"] == {"90309762": 2, "20409163": 1}
+    assert len(result["package_coordinates"]) == 4
+
+
+def test_main_passes_trunk_boxes_to_geometry_engine(databases, monkeypatch, tmp_path):
+    def find_unavailable_boxes(volume_space):
+        raise AssertionError("trunk boxes rebuilt from the volume space")
+
+    monkeypatch.setattr(geometryoptimizer, "find_unavailable_boxes", find_unavailable_boxes)
+    output = tmp_path / "result.json"
+    args = ["Test Car", "--articles", "903.097.62 (2), 204.091.63", *databases, "--engine", "geometry"]
+    assert willitfit_run.main([*args, "--improve-time", "0", "--output", str(output)]) == 0
+    assert len(json.loads(output.read_text())["package_coordinates"]) == 4
+
+
+def test_run_reports_errors(databases):
+    args = willitfit_run.parse_args(["Unknown Car", "--articles", "903.097.62", *databases])
+    assert willitfit_run.run(args)["error"] == CAR_MODEL_NOT_FOUND
+    args = willitfit_run.parse_args(["Test Car", "--articles", "100.000.01", *databases])
+    assert willitfit_run.run(args)["error"] == ARTICLE_NOT_FOUND
@@ -37,7 +37,7 @@ def form_to_dict(articles_list):
         if errors == 0:
             df = pd.DataFrame(df_dict)
             # Strip article dots
-            df["article_num"] = df["article_num"].str.replace(".", "", regex=True)
+            df["article_num"] = df["article_num"].str.replace(".", "", regex=False)
             # Convert n_pieces column to int
             df["n_pieces"] = df["n_pieces"].astype(int)
             return df.set_index("article_num").T.to_dict("index")["n_pieces"]
@@ -92,7 +92,7 @@ def pdf_to_df(uploaded_pdf, lang_code):
 
 def pdf_df_to_dict(df):
     # Strip article dots
-    df["article_num"] = df["article_num"].str.replace(".", "", regex=True)
+    df["article_num"] = df["article_num"].str.replace(".", "", regex=False)
     # Convert n_pieces column to int
     df["n_pieces"] = df["n_pieces"].astype(int)
     return df.set_index('article_num').T.to_dict('index')['n_pieces']
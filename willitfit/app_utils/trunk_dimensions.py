@@ -1,11 +1,100 @@
 import numpy as np
 import pandas as pd
-from willitfit.params import VOL_EMPTY, VOL_UNAVAILABLE
+import os
+from urllib.parse import quote, unquote
+from willitfit.params import (
+    VOL_EMPTY,
+    VOL_UNAVAILABLE,
+    VOL_DTYPE,
+    TRUNK_CACHE_FOLDER,
+    TRUNK_TEMPLATE_CACHE_SIZE,
+    TRUNK_PROFILES,
+    TRUNK_DEFAULT_PROFILE,
+)
 
-def get_volume_space(data, car_model, extra_depth=False):
+# Read-only trunk templates by (trunk_dims, car_config), most recently used last
+_VOLUME_SPACES = {}
+
+
+def find_slope_start(trunk_dims, profile):
+    """
+    Returns, for every x row, the height from which the trunk-door slope makes space unavailable.
+    The slope starts at ratio_height of the height in the rear row and rises by slant cm per row.
+    Rows not reached by the slope get the full trunk height.
+    """
+    X, _, Z = (int(i) for i in trunk_dims)
+    height_block = int(Z * profile["ratio_height"])
+    # Rows counted from the rear
+    row = X - 1 - np.arange(X)
+    return np.where(
+        row < height_block, np.minimum(height_block + profile["slant"] * row, Z), Z
+    )
+
+
+def build_fixture_boxes(trunk_dims, profile):
     """
-    Returns available volume for a specific car_model.
-    Use ratio_height to tweak estimated unavailable space caused by 45-degree trunk-door slope.
+    Returns wheel arches and floor steps of a profile as boxes (see build_trunk_boxes).
+    """
+    X, Y, Z = (int(i) for i in trunk_dims)
+    boxes = []
+    # Wheel arches on both sides
+    for x_start, x_end, width, height in profile["wheel_arches"]:
+        for y_start, y_end in ((0, int(Y * width)), (Y - int(Y * width), Y)):
+            boxes.append([int(X * x_start), y_start, 0, int(X * x_end), y_end, int(Z * height)])
+    # Raised floor sections across the full width
+    for x_start, x_end, height in profile["floor_steps"]:
+        boxes.append([int(X * x_start), 0, 0, int(X * x_end), Y, int(Z * height)])
+    return np.array(boxes, dtype=int).reshape(-1, 6)
+
+
+def build_trunk_boxes(trunk_dims, profile):
+    """
+    Returns analytic description of a trunk's unavailable space for a profile from TRUNK_PROFILES,
+    as array of [x_start, y_start, z_start, x_end, y_end, z_end] boxes (ends exclusive).
+    The slope is described by one box per x row it reaches.
+    """
+    _, Y, Z = (int(i) for i in trunk_dims)
+    slope_start = find_slope_start(trunk_dims, profile)
+    rows = np.flatnonzero(slope_start < Z)
+    slope_boxes = np.stack(
+        (
+            rows,
+            np.zeros_like(rows),
+            slope_start[rows],
+            rows + 1,
+            np.full_like(rows, Y),
+            np.full_like(rows, Z),
+        ),
+        axis=1,
+    )
+    return np.concatenate((slope_boxes, build_fixture_boxes(trunk_dims, profile)))
+
+
+def build_volume_space(trunk_dims, car_config):
+    """
+    Returns volume space for trunk dimensions and generic config, together with its
+    unavailable space as boxes (see build_trunk_boxes).
+    The shape is taken from TRUNK_PROFILES. The slope is painted in a single broadcasted
+    expression, wheel arches and floor steps are painted box by box.
+    """
+    profile = TRUNK_PROFILES.get(car_config, TRUNK_PROFILES[TRUNK_DEFAULT_PROFILE])
+    X, Y, Z = (int(i) for i in trunk_dims)
+    # Compare every height against the slope start of its row, the same across the full width
+    volume_space = np.empty((X, Y, Z), dtype=VOL_DTYPE)
+    volume_space[...] = np.where(
+        np.arange(Z)[None, None, :] >= find_slope_start(trunk_dims, profile)[:, None, None],
+        VOL_UNAVAILABLE,
+        VOL_EMPTY,
+    ).astype(VOL_DTYPE)
+    for x_start, y_start, z_start, x_end, y_end, z_end in build_fixture_boxes(trunk_dims, profile):
+        volume_space[x_start:x_end, y_start:y_end, z_start:z_end] = VOL_UNAVAILABLE
+    return volume_space, build_trunk_boxes(trunk_dims, profile)
+
+
+def get_trunk_spec(data, car_model, extra_depth=False):
+    """
+    Returns what the trunk of a car_model is built from: its dimensions and generic config.
+    Cars with the same trunk_dims and car_config share their template.
     """
     # Isolate dimension cols
     dim_cols = ["depth", "width", "height"]
@@ -20,21 +109,94 @@ def get_volume_space(data, car_model, extra_depth=False):
     else:
         trunk_dims = model_row[dim_cols].to_numpy(int)[0]
 
-    # Cuboid Volume Space
-    volume_space = np.full(trunk_dims, VOL_EMPTY, dtype=int)
+    return tuple(int(i) for i in trunk_dims), str(model_row["generic_config"].values[0])
 
-    # Unavailable space according to config
-    ## 2 Types: BOXY, SLANT
-    car_config = model_row['generic_config'].values
-    if car_config == 'BOXY':
-        ratio_height = 0.7
-        slant = 4
-    else:
-        ratio_height = 0.5
-        slant = 2
 
-    height_block = int(trunk_dims[2] * ratio_height)
-    for i in range(height_block):
-        volume_space[trunk_dims[0]-(i+1),:,height_block+(slant*i):] = VOL_UNAVAILABLE
+def get_template_path(trunk_dims, car_config, folder=TRUNK_CACHE_FOLDER, boxes=False):
+    """
+    Returns path of the .npy file holding a trunk template (or its boxes) in folder.
+    """
+    suffix = "boxes" if boxes else "trunk"
+    dimensions = "x".join(str(i) for i in trunk_dims)
+    # Dots separate the parts of the file name
+    car_config = quote(car_config, safe="").replace(".", "%2E")
+    return os.path.join(folder, f"{dimensions}.{car_config}.{suffix}.npy")
 
+
+def load_template(trunk_dims, car_config, folder):
+    """
+    Memory-maps a trunk template and loads its boxes from folder.
+    """
+    return (
+        np.load(get_template_path(trunk_dims, car_config, folder), mmap_mode="r"),
+        np.load(get_template_path(trunk_dims, car_config, folder, boxes=True)),
+    )
+
+
+def remember_template(key, template):
+    """
+    Keeps template in memory, evicting least recently used templates beyond TRUNK_TEMPLATE_CACHE_SIZE.
+    """
+    _VOLUME_SPACES.pop(key, None)
+    _VOLUME_SPACES[key] = template
+    while len(_VOLUME_SPACES) > TRUNK_TEMPLATE_CACHE_SIZE:
+        _VOLUME_SPACES.pop(next(iter(_VOLUME_SPACES)))
+
+
+def preload_volume_spaces(folder=TRUNK_CACHE_FOLDER):
+    """
+    Memory-maps trunk templates saved in folder, so they are available without building them.
+    Returns number of templates loaded, at most TRUNK_TEMPLATE_CACHE_SIZE are kept.
+    """
+    if folder is None or not os.path.isdir(folder):
+        return 0
+    loaded = 0
+    for file_name in sorted(os.listdir(folder)):
+        parts = file_name.split(".")
+        if len(parts) != 4 or parts[2:] != ["trunk", "npy"]:
+            continue
+        trunk_dims, car_config = tuple(int(i) for i in parts[0].split("x")), unquote(parts[1])
+        remember_template((trunk_dims, car_config), load_template(trunk_dims, car_config, folder))
+        loaded += 1
+    return loaded
+
+
+def clear_volume_spaces():
+    """
+    Empties the in-memory template cache. Files on disk are kept.
+    """
+    _VOLUME_SPACES.clear()
+
+
+def get_trunk_shape(data, car_model, extra_depth=False, folder=TRUNK_CACHE_FOLDER):
+    """
+    Returns available volume for a specific car_model, its dimensions and its unavailable space as boxes.
+    Trunks are built once per trunk dimensions and generic config, as found in data, and kept
+    as read-only templates, so callers need to copy the volume space before writing to it.
+    If folder is given, templates are also saved there and memory-mapped when loaded again.
+    """
+    key = get_trunk_spec(data, car_model, extra_depth=extra_depth)
+    trunk_dims, car_config = key
+    template = _VOLUME_SPACES.get(key)
+    if template is None and folder is not None and os.path.isfile(get_template_path(trunk_dims, car_config, folder)):
+        template = load_template(trunk_dims, car_config, folder)
+    if template is None:
+        template = build_volume_space(trunk_dims, car_config)
+        if folder is not None:
+            os.makedirs(folder, exist_ok=True)
+            np.save(get_template_path(trunk_dims, car_config, folder), template[0])
+            np.save(get_template_path(trunk_dims, car_config, folder, boxes=True), template[1])
+        for array in template:
+            array.flags.writeable = False
+    remember_template(key, template)
+    volume_space, boxes = template
+
+    return volume_space, np.array(volume_space.shape), boxes
+
+
+def get_volume_space(data, car_model, extra_depth=False, folder=TRUNK_CACHE_FOLDER):
+    """
+    Returns available volume for a specific car_model and its dimensions, see get_trunk_shape.
+    """
+    volume_space, trunk_dims, _ = get_trunk_shape(data, car_model, extra_depth=extra_depth, folder=folder)
     return volume_space, trunk_dims
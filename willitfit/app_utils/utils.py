@@ -4,6 +4,11 @@ from willitfit.params import (
     CAR_MODEL_CHOOSE,
     PROJECT_DIR,
     PROJECT_NAME,
+    DATA_FOLDER,
+    ARTICLE_DATABASE,
+    ARTICLE_NOT_FOUND,
+    DTYPE_DICT,
+    IKEA_DATABASE_DTYPES,
 )
 
 def get_local_data(path_to_csv, dtypes=None):
@@ -54,3 +59,64 @@ def dict_to_name_list(article_dict, product_names_df):
     for index, key in enumerate(article_dict):
         output_list.append(f"{name_list[index]} ({article_dict[key]})")
     return str(output_list).replace('[', '').replace("'", '').replace(']', '')
+
+def df_to_list(df, article_code):
+    """
+    Prepare output for API from data frame.
+    [(
+    article_code (str),
+    item_count (int),
+        [(
+        package_id (int),
+        package_length (int),
+        package_width (int),
+        package_height (int),
+        package_weight (float)
+        )]
+    )]
+    """
+    # Initialize empty list
+    return_list = []
+
+    # Loop over each article
+    for article, article_count in article_code.items():
+        # Sub-list when there are multiple packages
+        package_list = []
+        # Find all matches in dataframe
+        matched_packages = df[df["article_code"] == article]
+        # Loop over all packages
+        package_count = 1
+        for _, matched_package in matched_packages.iterrows():
+            # If the same package exists multiple times this will run more than once
+            for idx in range(int(matched_package["packages"])):
+                package_list.append(
+                    (
+                        package_count,
+                        int(matched_package["height"]),
+                        int(matched_package["width"]),
+                        int(matched_package["length"]),
+                        matched_package["weight"],
+                    )
+                )
+                # Append package ID, dimensions and weight
+                package_count += 1
+        # Append list of packages
+        return_list.append([article, article_count, package_list])
+    return return_list
+
+def find_local_articles(article_dict, path_to_csv=DATA_FOLDER + "/" + ARTICLE_DATABASE):
+    """
+    Look up articles in the local database only, without scraping IKEA.
+    Returns:
+        return_list - list required for optimizer
+        product_names - pd.dataframe containing article_code & product_name
+    Returns ARTICLE_NOT_FOUND if any article is not in the database.
+    """
+    ikea_database = get_local_data(path_to_csv, DTYPE_DICT).astype(IKEA_DATABASE_DTYPES)
+    ordered_product_df = ikea_database[ikea_database["article_code"].isin([*article_dict])]
+    if set(article_dict) - set(ordered_product_df["article_code"]):
+        return ARTICLE_NOT_FOUND
+    product_names = ordered_product_df[["article_code", "product_name"]].drop_duplicates().set_index(
+        ["article_code"]
+    )
+    return df_to_list(ordered_product_df, article_dict), product_names
@@ -0,0 +1,234 @@
+"""
+Checks which of several car models fit one article list.
+Runs the fast feasibility checks for every car first, so that only cars that may fit reach the optimizer.
+Optimizer tasks of all remaining cars are then submitted to the shared worker pool at once,
+so that workers never wait for a single car to finish. Car models with identical trunks are only optimized once.
+
+RELEVANT CALLABLE FUNCTION:
+generate_batch(
+    article_list (list of IKEA articles),
+    data (car database),
+    car_models (list of car models to check),
+    extra_depth (whether to use the extra depth of every trunk),
+    worker_pool (optional multiprocessing pool, defaults to the long-lived pool of the volume optimizer),
+    optimizer settings (as taken by generate_optimizer, except resolution, which is not supported)
+    )
+"""
+
+from willitfit.params import (
+    BIAS_STACKS,
+    CAR_MODEL_NOT_FOUND,
+    ERRORS_OPTIMIZER,
+    GEN_SORTERS,
+    OPT_BACKTRACK_DEPTH,
+    OPT_ENGINE,
+    OPT_IMPROVE_TIME,
+    OPT_MAX_ATTEMPTS,
+    OPT_PLACEMENT_RULES,
+    OPT_SEED,
+    OPT_TARGET_SCORE,
+    OPT_TIME_BUDGET,
+    OPT_WORKER_COUNT,
+    RANDOM_LIST_COUNT,
+)
+from willitfit.app_utils.trunk_dimensions import get_trunk_shape
+from willitfit.optimizers.resultcache import get_result_cache
+from willitfit.optimizers.volumeoptimizer import (
+    check_trunk_profile,
+    fill_space,
+    finish_optimizer,
+    get_trunk_profile,
+    get_worker_pool,
+    make_optimizer_cache_key,
+    start_optimizer_tasks,
+)
+from itertools import zip_longest
+import multiprocessing
+import numpy as np
+import pandas as pd
+import time
+
+BATCH_COLUMNS = [
+    "car_model",
+    "fits",
+    "message",
+    "depth",
+    "width",
+    "height",
+    "free_volume",
+    "seconds",
+    "package_coordinates",
+]
+
+
+def run_tagged_task(tagged_task):
+    """
+    Worker entry point for tasks of several trunks in one stream.
+    Runs task with its task function and returns the result together with the index of its trunk.
+    """
+    trunk_index, task_function, task = tagged_task
+    return trunk_index, task_function(task)
+
+
+def merge_task_streams(task_streams):
+    """
+    Takes one (task function, tasks) pair per trunk and yields tagged tasks for run_tagged_task,
+    taking turns between trunks so that every trunk gets workers early on.
+    Tasks of a trunk are skipped once its cancellation flag is set.
+    """
+    for round_tasks in zip_longest(*(tasks for _, _, tasks in task_streams)):
+        for trunk_index, task in enumerate(round_tasks):
+            cancel_flag, task_function, _ = task_streams[trunk_index]
+            if task is None or cancel_flag.is_set():
+                continue
+            yield trunk_index, task_function, task
+
+
+def generate_batch(
+    article_list,
+    data,
+    car_models,
+    extra_depth=False,
+    worker_pool=None,
+    worker_count=OPT_WORKER_COUNT,
+    generator_sorters=GEN_SORTERS,
+    generator_random_lists=RANDOM_LIST_COUNT,
+    optimizer_max_attempts=OPT_MAX_ATTEMPTS,
+    bias_options=BIAS_STACKS,
+    time_budget=OPT_TIME_BUDGET,
+    target_score=OPT_TARGET_SCORE,
+    optimizer_backtrack_depth=OPT_BACKTRACK_DEPTH,
+    placement_rules=OPT_PLACEMENT_RULES,
+    seed=OPT_SEED,
+    result_cache=None,
+    engine=OPT_ENGINE,
+    improve_time=OPT_IMPROVE_TIME,
+):
+    """
+    Main function to run this module.
+    Returns a table with one row per car model, stating whether article_list fits (fits),
+    the error code if it does not (message), trunk dimensions and free volume,
+    time spent on that car (seconds, including the optimizer time shared by all cars)
+    and package coordinates of the solution found.
+    All trunks share one time budget. Once a trunk reaches target_score, its remaining tasks are cancelled.
+    """
+    if worker_pool is None:
+        worker_pool = get_worker_pool()
+    if result_cache is None:
+        result_cache = get_result_cache()
+    rows = {}
+    # Trunks that passed the feasibility checks, with the car models sharing them
+    candidates = {}
+    for car_model in dict.fromkeys(car_models):
+        begin_time = time.time()
+        if not (data["car_model"] == car_model).any():
+            rows[car_model] = [car_model, False, CAR_MODEL_NOT_FOUND, None, None, None, None, 0.0, None]
+            continue
+        volume_space, trunk_dims, trunk_boxes = get_trunk_shape(data, car_model, extra_depth=extra_depth)
+        # Identical trunks share the same profile
+        trunk_profile = get_trunk_profile(volume_space)
+        feasibility = check_trunk_profile(article_list, trunk_profile)
+        rows[car_model] = [
+            car_model,
+            False,
+            feasibility,
+            *(int(i) for i in trunk_dims),
+            trunk_profile.free_volume,
+            time.time() - begin_time,
+            None,
+        ]
+        if feasibility is None:
+            candidates.setdefault(trunk_profile, (volume_space, trunk_boxes, []))[2].append(car_model)
+    print(f"{len(candidates)} of {len(rows)} trunks passed feasibility checks")
+    begin_time = time.time()
+    # Settings each task is set up with
+    task_settings = dict(
+        generator_sorters=generator_sorters,
+        generator_random_lists=generator_random_lists,
+        optimizer_max_attempts=optimizer_max_attempts,
+        bias_options=bias_options,
+        optimizer_backtrack_depth=optimizer_backtrack_depth,
+        placement_rules=placement_rules,
+        engine=engine,
+    )
+    # Same cache entries as generate_optimizer
+    settings = dict(task_settings, target_score=target_score, seed=seed, improve_time=improve_time)
+    # Optimizer results of each trunk, from the cache or the worker pool
+    trunk_returns = {}
+    # Trunks left to optimize, with their cache key, random streams and shared space
+    trunks = []
+    try:
+        for trunk_profile, (volume_space, trunk_boxes, trunk_models) in candidates.items():
+            if result_cache:
+                cache_key = make_optimizer_cache_key(article_list, volume_space, time_budget, settings)
+                package_coordinates = result_cache.get(cache_key, article_list)
+                if package_coordinates is not None:
+                    trunk_returns[trunk_profile] = (
+                        fill_space(np.copy(volume_space), package_coordinates),
+                        package_coordinates,
+                    )
+                    continue
+            else:
+                cache_key = None
+            # Same random streams as when optimizing this trunk on its own
+            seed_sequence = np.random.SeedSequence(seed)
+            # Workers stop early once the deadline has passed or the cancellation flag is set
+            deadline = None if time_budget is None else begin_time + time_budget
+            shared_block, cancel_flag, task_function, tasks = start_optimizer_tasks(
+                article_list, volume_space, deadline, seed_sequence, trunk_boxes=trunk_boxes, **task_settings
+            )
+            trunks.append((trunk_profile, cache_key, seed_sequence, shared_block, cancel_flag, task_function, tasks))
+        # Set up an empty list for each trunk
+        return_vals = [[] for _ in trunks]
+        # Submit tasks of all trunks to the worker pool and receive return values as they complete
+        responses = worker_pool.imap_unordered(
+            run_tagged_task, merge_task_streams([trunk[4:] for trunk in trunks])
+        )
+        while trunks:
+            try:
+                timeout = None if time_budget is None else max(begin_time + time_budget - time.time(), 0)
+                trunk_index, response = responses.next(timeout)
+            except (StopIteration, multiprocessing.TimeoutError):
+                # All tasks done or time budget used up
+                break
+            if response not in ERRORS_OPTIMIZER:
+                return_vals[trunk_index].append(response)
+                # Good enough for this trunk, no need to wait for the rest of its tasks
+                if target_score is not None and response[0] <= target_score:
+                    trunks[trunk_index][4].set()
+                    if all(trunk[4].is_set() for trunk in trunks):
+                        break
+    finally:
+        # Cancel remaining work
+        for trunk in trunks:
+            trunk[4].set()
+            trunk[3].close()
+            trunk[3].unlink()
+    print(f"Batch optimizer time: {time.time()-begin_time}")
+    # Pick and improve the best stacking of each trunk
+    for trunk_index, (trunk_profile, cache_key, seed_sequence, *_) in enumerate(trunks):
+        volume_space = candidates[trunk_profile][0]
+        deadline = None if time_budget is None else begin_time + time_budget
+        optimizer_return = finish_optimizer(
+            return_vals[trunk_index],
+            article_list,
+            volume_space,
+            deadline,
+            improve_time,
+            worker_pool,
+            seed_sequence,
+            worker_count,
+        )
+        if optimizer_return not in ERRORS_OPTIMIZER and result_cache:
+            result_cache.put(cache_key, optimizer_return[1])
+        trunk_returns[trunk_profile] = optimizer_return
+    seconds = time.time() - begin_time
+    for trunk_profile, optimizer_return in trunk_returns.items():
+        for car_model in candidates[trunk_profile][2]:
+            row = rows[car_model]
+            row[7] += seconds
+            if optimizer_return in ERRORS_OPTIMIZER:
+                row[2] = optimizer_return
+            else:
+                row[1], row[8] = True, optimizer_return[1]
+    return pd.DataFrame(list(rows.values()), columns=BATCH_COLUMNS)
@@ -0,0 +1,289 @@
+"""
+Alternative placement engine that works on box geometry instead of a voxel grid.
+The trunk is described by its dimensions and a list of unavailable boxes, placed packages
+are kept as a list of boxes as well. Packages go to extreme points, i.e. corners next to
+already placed packages, which are checked against all boxes in a single vectorized test.
+Work per placement grows with the number of packages rather than with the trunk volume.
+Returns package coordinates in the same format as the voxel engine.
+
+RELEVANT CALLABLE FUNCTIONS:
+find_unavailable_boxes(volume_space) (box description of a voxel trunk)
+geometry_optimizer(package_list, article_list, trunk_dims, obstacles, ...)
+"""
+
+from willitfit.params import (
+    OPT_MAX_ATTEMPTS,
+    OPT_INSUFFICIENT_SPACE,
+    OPT_UNSUCCESSFUL,
+    OPT_BACKTRACK_DEPTH,
+    OPT_PLACEMENT_RULE,
+    PLACEMENT_RULES,
+)
+from willitfit.optimizers.volumeoptimizer import (
+    binarize_space,
+    is_cancelled,
+    attach_shared_space,
+    stack_packages,
+)
+import numpy as np
+
+
+def find_column_runs(column):
+    """
+    Returns (start, end) pairs of consecutive True cells in a boolean column, end exclusive.
+    """
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], column.view(np.int8), [0]))))
+    return tuple(zip(edges[::2].tolist(), edges[1::2].tolist()))
+
+
+def find_unavailable_boxes(volume_space):
+    """
+    Describes all non-empty cells of volume_space as a list of boxes.
+    Runs along z are merged across identical neighbouring columns along y,
+    and the resulting rectangles across identical neighbouring slices along x.
+    Returns array of [x_start, y_start, z_start, x_end, y_end, z_end] rows, ends exclusive.
+    """
+    blocked = ~binarize_space(volume_space)
+    X, Y, _ = blocked.shape
+    boxes = []
+    # Rectangles (y_start, y_end, z_start, z_end) still growing along x, with their x_start
+    open_boxes = {}
+    rectangles = set()
+    for x in range(X):
+        if x == 0 or not np.array_equal(blocked[x], blocked[x - 1]):
+            rectangles = set()
+            # Only look at columns that differ from their predecessor
+            changes = np.flatnonzero(np.any(blocked[x, 1:] != blocked[x, :-1], axis=1)) + 1
+            bounds = np.concatenate(([0], changes, [Y])).tolist()
+            for y_start, y_end in zip(bounds[:-1], bounds[1:]):
+                for z_start, z_end in find_column_runs(blocked[x, y_start]):
+                    rectangles.add((y_start, y_end, z_start, z_end))
+            # Neighbouring column groups with the same run are joined
+            merged = set()
+            for rectangle in sorted(rectangles):
+                y_start, y_end, z_start, z_end = rectangle
+                previous = next(
+                    (r for r in merged if r[1] == y_start and r[2:] == (z_start, z_end)), None
+                )
+                if previous is not None:
+                    merged.remove(previous)
+                    y_start = previous[0]
+                merged.add((y_start, y_end, z_start, z_end))
+            rectangles = merged
+        # Close boxes that do not continue into this slice
+        for rectangle in [r for r in open_boxes if r not in rectangles]:
+            y_start, y_end, z_start, z_end = rectangle
+            boxes.append((open_boxes.pop(rectangle), y_start, z_start, x, y_end, z_end))
+        for rectangle in rectangles:
+            open_boxes.setdefault(rectangle, x)
+    for (y_start, y_end, z_start, z_end), x_start in open_boxes.items():
+        boxes.append((x_start, y_start, z_start, X, y_end, z_end))
+    return np.array(sorted(boxes), dtype=int).reshape(-1, 6)
+
+
+class BoxSpace:
+    """
+    Trunk represented by its dimensions and a list of occupied boxes.
+    The first boxes are the trunk's unavailable region, placed packages are appended after them.
+    Extreme points and an undo log work like in SpaceIndex of the voxel engine.
+    """
+
+    def __init__(self, trunk_dims, obstacles):
+        self.trunk_dims = np.array(trunk_dims, dtype=int)
+        self.boxes = np.array(obstacles, dtype=int).reshape(-1, 6)
+        # Stacking starts from the origin corner of the trunk
+        self.extreme_points = [(0, 0, 0)]
+        # Undo log of extreme points before each placement
+        self.undo_log = []
+
+    def collides(self, starts, dimensions):
+        """
+        Returns boolean array, True where a box at starts with dimensions leaves the trunk
+        or overlaps any occupied box. starts and dimensions are (n, 3) arrays.
+        """
+        ends = starts + dimensions
+        inside = np.all(starts >= 0, axis=-1) & np.all(ends <= self.trunk_dims, axis=-1)
+        # Boxes overlap if they overlap along every axis
+        overlaps = np.all(
+            (starts[:, None, :] < self.boxes[None, :, 3:])
+            & (self.boxes[None, :, :3] < ends[:, None, :]),
+            axis=2,
+        )
+        return ~inside | np.any(overlaps, axis=1)
+
+    def project_point(self, point):
+        """
+        Moves a point down (z), then back (x), then sideways (y) until it rests on something.
+        """
+        point = list(point)
+        for axis in (2, 0, 1):
+            other = [i for i in range(3) if i != axis]
+            # Boxes behind the point whose cross-section contains it
+            behind = (
+                np.all(self.boxes[:, other] <= np.take(point, other), axis=1)
+                & np.all(np.take(point, other) < self.boxes[:, [i + 3 for i in other]], axis=1)
+                & (self.boxes[:, axis + 3] <= point[axis])
+            )
+            point[axis] = int(self.boxes[behind, axis + 3].max()) if behind.any() else 0
+        return tuple(point)
+
+    def add_package(self, x, y, z, package_x, package_y, package_z):
+        """
+        Adds package box and updates extreme points. The placement is recorded in the undo log.
+        """
+        self.undo_log.append(self.extreme_points)
+        self.boxes = np.vstack(
+            (self.boxes, (x, y, z, x + package_x, y + package_y, z + package_z))
+        )
+        # Drop points now covered by the package
+        points = [
+            point
+            for point in self.extreme_points
+            if not (
+                x <= point[0] < x + package_x
+                and y <= point[1] < y + package_y
+                and z <= point[2] < z + package_z
+            )
+        ]
+        # Add the three corners adjacent to the package
+        for point in [
+            (x + package_x, y, z),
+            (x, y + package_y, z),
+            (x, y, z + package_z),
+        ]:
+            # Ignore anything outside the trunk or inside another box
+            if self.collides(np.array([point]), np.ones((1, 3), dtype=int))[0]:
+                continue
+            point = self.project_point(point)
+            if point not in points:
+                points.append(point)
+        self.extreme_points = points
+
+    def remove_package(self):
+        """
+        Undoes the most recent placement.
+        Returns the removed package's starting coordinates and dimensions.
+        """
+        self.extreme_points = self.undo_log.pop()
+        box, self.boxes = self.boxes[-1], self.boxes[:-1]
+        return tuple(int(i) for i in box[:3]) + tuple(int(i) for i in box[3:] - box[:3])
+
+    def find_best_space(self, orientations, axes=PLACEMENT_RULES[OPT_PLACEMENT_RULE]):
+        """
+        Evaluates all orientations at all extreme points at once and returns the best
+        (orientation, position) pair. Positions are compared along axes in the given order,
+        ties go to the earlier orientation.
+        """
+        orientations = np.array(orientations, dtype=int).reshape(-1, 3)
+        points = np.array(self.extreme_points, dtype=int).reshape(-1, 3)
+        # Every combination of orientation and extreme point, orientation-major
+        orientation_idx = np.repeat(np.arange(len(orientations)), len(points))
+        point_idx = np.tile(np.arange(len(points)), len(orientations))
+        free = np.flatnonzero(~self.collides(points[point_idx], orientations[orientation_idx]))
+        if len(free) == 0:
+            return OPT_INSUFFICIENT_SPACE
+        keys = points[point_idx[free]][:, list(axes)]
+        best = free[np.lexsort((orientation_idx[free], keys[:, 2], keys[:, 1], keys[:, 0]))[0]]
+        return (
+            tuple(int(i) for i in orientations[orientation_idx[best]]),
+            tuple(int(i) for i in points[point_idx[best]]),
+        )
+
+
+def score_boxes(box_space):
+    """
+    Scores a stacking by the empty volume inside the bounding box of all placed packages.
+    Lower scores are better, as packages are stacked more tightly into a corner of the trunk.
+    """
+    packages = box_space.boxes[len(box_space.boxes) - len(box_space.undo_log):]
+    package_volume = np.prod(packages[:, 3:] - packages[:, :3], axis=1).sum(dtype=float)
+    bounding_volume = np.prod(packages[:, 3:].max(axis=0), dtype=float)
+    return np.log(max(bounding_volume - package_volume, 0) + 1)
+
+
+def geometry_optimizer(
+    package_list,
+    article_list,
+    trunk_dims,
+    obstacles,
+    max_attempts=OPT_MAX_ATTEMPTS,
+    biased=True,
+    bias_tendency=0.8,
+    deadline=None,
+    cancel_event=None,
+    backtrack_depth=OPT_BACKTRACK_DEPTH,
+    placement_rule=None,
+    rng=None,
+):
+    """
+    Places packages sequentially at extreme points of a BoxSpace.
+    Orientations, retries and backtracking are handled by stack_packages like in the voxel engine,
+    identical packages are placed one at a time.
+    Only extreme points are tried, so a package that does not fit at any of them counts as a failure.
+    Returns score, attempts taken and package coordinates (there is no filled space to return).
+    """
+    result = stack_packages(
+        package_list,
+        article_list,
+        lambda: BoxSpace(trunk_dims, obstacles),
+        max_attempts=max_attempts,
+        biased=biased,
+        bias_tendency=bias_tendency,
+        deadline=deadline,
+        cancel_event=cancel_event,
+        backtrack_depth=backtrack_depth,
+        placement_rule=placement_rule,
+        rng=rng,
+    )
+    if result == OPT_UNSUCCESSFUL:
+        return OPT_UNSUCCESSFUL
+    attempts_counter, box_space, package_coordinates = result
+    return score_boxes(box_space), attempts_counter, package_coordinates
+
+
+def run_geometry_task(task):
+    """
+    Runs a single geometry optimizer task in a pool worker.
+    Takes the same task tuple as run_optimizer_task, with the space entry holding the shared
+    memory handle (only used for its cancellation flag), trunk dimensions and obstacles.
+    The scorer of the voxel engine is not used.
+    """
+    (
+        package_list,
+        article_list,
+        (space_handle, trunk_dims, obstacles),
+        max_attempts,
+        biased,
+        bias_tendency,
+        deadline,
+        backtrack_depth,
+        placement_rule,
+        seed_sequence,
+        _,
+    ) = task
+    # Skip tasks that are no longer needed
+    if is_cancelled(deadline):
+        return OPT_UNSUCCESSFUL
+    try:
+        shared_block, _, cancel_flag = attach_shared_space(space_handle, copy_space=False)
+    except FileNotFoundError:
+        # Request has finished already and released its shared memory
+        return OPT_UNSUCCESSFUL
+    try:
+        response = geometry_optimizer(
+            package_list,
+            article_list,
+            trunk_dims,
+            obstacles,
+            max_attempts=max_attempts,
+            biased=biased,
+            bias_tendency=bias_tendency,
+            deadline=deadline,
+            cancel_event=cancel_flag,
+            backtrack_depth=backtrack_depth,
+            placement_rule=placement_rule,
+            rng=np.random.default_rng(seed_sequence),
+        )
+    finally:
+        shared_block.close()
+    return response
@@ -0,0 +1,171 @@
+"""
+Content-addressed cache for optimizer results.
+Results are keyed by trunk geometry, the multiset of package dimensions and optimizer settings,
+so the same wishlist against the same car returns its package coordinates without re-running the optimizer.
+Keeps the most recently used results in memory and can optionally persist them to a folder.
+
+RELEVANT CALLABLE FUNCTIONS:
+get_result_cache() (cache shared by all requests, configured in params.py)
+make_cache_key(article_list, volume_space, settings)
+ResultCache.get(key, article_list)
+ResultCache.put(key, package_coordinates)
+"""
+
+from willitfit.params import (
+    RESULT_CACHE_SIZE,
+    RESULT_CACHE_FOLDER,
+    PROJECT_DIR,
+    PROJECT_NAME,
+)
+from collections import OrderedDict
+import hashlib
+import json
+import numpy as np
+import os
+
+
+def canonical_dimensions(package):
+    """
+    Returns package dimensions independent of orientation.
+    """
+    return tuple(sorted(int(dimension) for dimension in package[1:4]))
+
+
+def canonical_packages(article_list):
+    """
+    Returns sorted list of canonical dimensions for every single package in article_list.
+    Identical packages from different articles are indistinguishable.
+    """
+    return sorted(
+        canonical_dimensions(package)
+        for article in article_list
+        for _ in range(article[1])
+        for package in article[2]
+    )
+
+
+def make_cache_key(article_list, volume_space, settings):
+    """
+    Returns a hex digest identifying trunk geometry, package multiset and optimizer settings.
+    Settings must be representable as JSON (tuples become lists).
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(json.dumps(volume_space.shape).encode())
+    digest.update(volume_space.dtype.str.encode())
+    digest.update(np.ascontiguousarray(volume_space).tobytes())
+    digest.update(json.dumps(canonical_packages(article_list)).encode())
+    digest.update(json.dumps(settings, sort_keys=True, default=str).encode())
+    return digest.hexdigest()
+
+
+def to_canonical_coordinates(package_coordinates):
+    """
+    Strips article information from package coordinates, keeping placement order.
+    Returns [[dimension_1, dimension_2, dimension_3, x_start, y_start, z_start, x_end, y_end, z_end]]
+    with dimensions sorted in ascending order.
+    """
+    canonical = []
+    for coordinates in package_coordinates:
+        start, end = coordinates[3:6], coordinates[6:9]
+        dimensions = sorted(int(e) - int(s) + 1 for s, e in zip(start, end))
+        canonical.append(dimensions + [int(i) for i in start] + [int(i) for i in end])
+    return canonical
+
+
+def from_canonical_coordinates(canonical, article_list):
+    """
+    Assigns the packages in article_list to canonical coordinates with matching dimensions.
+    Returns package coordinates in the optimizer's format, or None if packages do not match.
+    """
+    # Available packages for each set of dimensions, in article order
+    available = {}
+    for article in article_list:
+        for article_id in range(article[1]):
+            for package in article[2]:
+                available.setdefault(canonical_dimensions(package), []).append(
+                    (article[0], article_id + 1, package[0])
+                )
+    for packages in available.values():
+        packages.reverse()
+    package_coordinates = []
+    for placement in canonical:
+        packages = available.get(tuple(placement[:3]))
+        if not packages:
+            return None
+        package_coordinates.append(list(packages.pop()) + placement[3:])
+    return package_coordinates
+
+
+class ResultCache:
+    """
+    Least recently used cache of optimizer results, optionally backed by a folder of JSON files.
+    """
+
+    def __init__(self, max_size=RESULT_CACHE_SIZE, folder=RESULT_CACHE_FOLDER):
+        self.max_size = max_size
+        self.folder = folder
+        self.entries = OrderedDict()
+        if folder is not None:
+            os.makedirs(folder, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.folder, f"{key}.json")
+
+    def get(self, key, article_list):
+        """
+        Returns cached package coordinates for key, assigned to the packages in article_list.
+        Returns None if there is no cached result.
+        """
+        canonical = self.entries.get(key)
+        if canonical is None and self.folder is not None and os.path.isfile(self._path(key)):
+            with open(self._path(key)) as f:
+                canonical = json.load(f)
+            self._remember(key, canonical)
+        if canonical is None:
+            return None
+        if key in self.entries:
+            self.entries.move_to_end(key)
+        return from_canonical_coordinates(canonical, article_list)
+
+    def put(self, key, package_coordinates):
+        """
+        Stores package coordinates under key.
+        """
+        canonical = to_canonical_coordinates(package_coordinates)
+        self._remember(key, canonical)
+        if self.folder is not None:
+            with open(self._path(key), "w") as f:
+                json.dump(canonical, f)
+
+    def _remember(self, key, canonical):
+        """
+        Adds entry in memory, evicting least recently used entries beyond max_size.
+        """
+        self.entries[key] = canonical
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Empties in-memory entries. Files on disk are kept.
+        """
+        self.entries.clear()
+
+
+# Cache shared by all requests, created on first use
+_RESULT_CACHE = None
+
+
+def get_result_cache():
+    """
+    Returns the cache shared by all requests, creating it if needed.
+    A relative RESULT_CACHE_FOLDER is resolved within the package like the data folder.
+    """
+    global _RESULT_CACHE
+    if _RESULT_CACHE is None:
+        folder = RESULT_CACHE_FOLDER
+        if folder is not None and not os.path.isabs(folder):
+            folder = str(PROJECT_DIR / PROJECT_NAME / folder)
+        _RESULT_CACHE = ResultCache(max_size=RESULT_CACHE_SIZE, folder=folder)
+    return _RESULT_CACHE
@@ -10,7 +10,21 @@ generate_optimizer(
     volume_space (available space as numpy array),
     generator_sorters (pre-defined sorters),
     generator_random_lists (how many random lists on top of sorted ones to try and optimize),
-    optimizer_max_attempts (number of times optimizer will try to fill space using different approaches)
+    optimizer_max_attempts (number of times optimizer will try to fill space using different approaches),
+    bias_options (orientation biases to run for each list),
+    worker_pool (optional multiprocessing pool, defaults to the long-lived pool of this module),
+    worker_count (number of processes in worker_pool, as many improvement runs are started),
+    time_budget (optional number of seconds after which the best solution so far is returned),
+    target_score (optional score at which a solution is accepted straight away),
+    optimizer_backtrack_depth (number of placements undone before retrying, 0 to always restart),
+    placement_rules (optional placement rules to run instead of bias_options, evaluating all orientations),
+    seed (optional seed, making runs reproducible),
+    result_cache (optional ResultCache, defaults to the shared cache, False to bypass caching),
+    resolution (cell size in cm to solve on first, 1 for full resolution only),
+    improve_time (optional number of seconds spent improving the best stacking),
+    trunk_profile (optional TrunkProfile of volume_space, looked up by trunk if not given),
+    trunk_boxes (optional unavailable space of volume_space as boxes, used by the geometry engine)
+    engine ("voxel" to place packages on the volume_space grid, "geometry" to place them as boxes)
     )
 """
 
@@ -23,17 +37,39 @@ from willitfit.params import (
     VOL_UNAVAILABLE,
     VOL_BORDER,
     VOL_EMPTY,
+    VOL_DTYPE,
     INSUFFICIENT_SPACE,
     INSUFFICIENT_DIMENSION,
     OPT_INSUFFICIENT_SPACE,
     OPT_UNSUCCESSFUL,
     BIAS_STACKS,
+    OPT_WORKER_COUNT,
+    OPT_TIME_BUDGET,
+    OPT_TARGET_SCORE,
+    OPT_TIME_BUDGET_EXCEEDED,
+    OPT_BACKTRACK_DEPTH,
+    OPT_PLACEMENT_RULE,
+    OPT_PLACEMENT_RULES,
+    PLACEMENT_RULES,
+    OPT_SEED,
+    OPT_RESOLUTION,
+    OPT_ENGINE,
+    OPT_GROUP_PACKAGES,
+    OPT_LAYER_MIN_PACKAGES,
+    OPT_IMPROVE_TIME,
+    OPT_IMPROVE_TEMPERATURES,
+    TRUNK_PROFILE_CACHE_SIZE,
 )
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+import hashlib
+import itertools
 from scipy.ndimage.measurements import label
-from scipy.special import factorial as fctrl
+from scipy.special import gammaln
 import multiprocessing
+from multiprocessing import resource_tracker, shared_memory
 import time
+from willitfit.optimizers.resultcache import get_result_cache, make_cache_key
 
 """
 General functions
@@ -42,10 +78,11 @@ General functions
 
 def binarize_space(volume_space):
     """
-    Sets empty space to 1 and rest to 0.
+    Sets empty space to True and rest to False.
     Needed to be able to identify clusters.
+    Returns a compact boolean occupancy mask.
     """
-    return np.isin(volume_space, VOL_EMPTY).astype(int)
+    return volume_space == VOL_EMPTY
 
 
 """
@@ -106,35 +143,23 @@ def find_longest_package_dimension(article_list):
     )
 
 
+def find_run_lengths(bin_space, axis):
+    """
+    Returns, for every cell, the length of the run of empty cells along axis ending at that cell.
+    """
+    counts = np.cumsum(bin_space, axis=axis, dtype=np.int32)
+    # Count at the last occupied cell before each cell
+    resets = np.maximum.accumulate(np.where(bin_space, 0, counts), axis=axis)
+    return counts - resets
+
+
 def find_longest_space_dimension(volume_space):
     """
     Determines the longest continuous stretch of empty space in all three dimensions.
     """
-    # Linear structures in all three axes
-    structure_y = [
-        [[0, 0, 0], [0, 0, 0], [0, 0, 0]],
-        [[0, 1, 0], [0, 1, 0], [0, 1, 0]],
-        [[0, 0, 0], [0, 0, 0], [0, 0, 0]],
-    ]
-    structure_x = np.rot90(structure_y, axes=(1, 2))
-    structure_z = np.rot90(structure_y, axes=(0, 1))
-    structures = [structure_x, structure_y, structure_z]
-
-    # Run along each dimension
-    results = []
-    for structure in structures:
-        # Binarize the space, then label along given dimension
-        dim_result = label(input=binarize_space(volume_space), structure=structure)[0]
-        # Turn into a 1-dimensional array
-        dim_result = np.reshape(dim_result, dim_result.size)
-        # Remove zeros
-        dim_result = np.delete(dim_result, np.where(dim_result == 0))
-        # Find most frequent occurrence
-        most_freq = np.bincount(dim_result).argmax()
-        # Return number of occurrences, which is equal to dimension in cm
-        results.append(np.count_nonzero(dim_result == most_freq))
+    bin_space = binarize_space(volume_space)
     # Return largest value from the three dimensions
-    return max(results)
+    return max(int(find_run_lengths(bin_space, axis).max()) for axis in range(3))
 
 
 def is_longest_dimension_sufficient(article_list, volume_space):
@@ -146,6 +171,79 @@ def is_longest_dimension_sufficient(article_list, volume_space):
     )
 
 
+class TrunkProfile:
+    """
+    Summary of a trunk's empty space, computed once per trunk and reused for every request.
+    Holds free volume, the longest empty run along each axis and, for every x slice,
+    the longest empty run across y and along z (its clearance, reduced by a slanted trunk door).
+    """
+
+    def __init__(self, volume_space):
+        bin_space = binarize_space(volume_space)
+        self.shape = bin_space.shape
+        self.free_volume = int(np.count_nonzero(bin_space))
+        # Longest runs along each axis, for every line along that axis
+        runs = [find_run_lengths(bin_space, axis).max(axis=axis) for axis in range(3)]
+        self.max_runs = tuple(int(run.max()) for run in runs)
+        # Clearance of each x slice, across y (runs[1] is x by z) and along z (runs[2] is x by y)
+        self.slice_width = runs[1].max(axis=1)
+        self.slice_height = runs[2].max(axis=1)
+
+    def fits_package(self, package_length, package_width, package_height):
+        """
+        Returns False if a package cannot fit anywhere in any orientation.
+        A package needs enough consecutive x slices that are all at least as wide and high as the package.
+        Passing this check does not guarantee that the package fits.
+        """
+        for package_x, package_y, package_z in get_orientations(package_length, package_width, package_height):
+            if package_x > self.shape[0]:
+                continue
+            # Smallest clearance within each window of package_x consecutive slices
+            width = sliding_window_view(self.slice_width, package_x).min(axis=1)
+            height = sliding_window_view(self.slice_height, package_x).min(axis=1)
+            if np.any((width >= package_y) & (height >= package_z)):
+                return True
+        return False
+
+
+def check_trunk_profile(article_list, trunk_profile):
+    """
+    Runs fast feasibility checks of article_list against a TrunkProfile.
+    Returns an error code if packages cannot fit, otherwise None.
+    """
+    # Package volume needs to be smaller than or equal to available space
+    if find_total_package_volume(article_list) > trunk_profile.free_volume:
+        return INSUFFICIENT_SPACE
+    # Longest package dimension needs to be smaller than or equal to longest space dimension
+    if find_longest_package_dimension(article_list) > max(trunk_profile.max_runs):
+        return INSUFFICIENT_DIMENSION
+    # Every package needs to fit below the slant somewhere
+    dimensions = {tuple(sorted(package[1:4])) for article in article_list for package in article[2]}
+    if not all(trunk_profile.fits_package(*package_dimensions) for package_dimensions in dimensions):
+        return INSUFFICIENT_DIMENSION
+    return None
+
+
+# Trunk profiles by trunk digest, most recently used last
+_TRUNK_PROFILES = {}
+
+
+def get_trunk_profile(volume_space):
+    """
+    Returns the TrunkProfile of volume_space, reusing profiles of identical trunks.
+    """
+    digest = hashlib.blake2b(str(volume_space.shape).encode(), digest_size=16)
+    digest.update(np.ascontiguousarray(volume_space).tobytes())
+    key = digest.hexdigest()
+    trunk_profile = _TRUNK_PROFILES.pop(key, None)
+    if trunk_profile is None:
+        trunk_profile = TrunkProfile(volume_space)
+    _TRUNK_PROFILES[key] = trunk_profile
+    while len(_TRUNK_PROFILES) > TRUNK_PROFILE_CACHE_SIZE:
+        _TRUNK_PROFILES.pop(next(iter(_TRUNK_PROFILES)))
+    return trunk_profile
+
+
 """
 Penalizer/scorer functions
 """
@@ -166,66 +264,40 @@ def find_empty_space(volume_space):
     # What's the total volume of empty space?
     empty_volume = np.count_nonzero(dim_result)
     # What's the volume of the largest empty space?
-    largest_volume = np.count_nonzero(dim_result == number_spaces)
+    largest_volume = np.bincount(dim_result.ravel())[1:].max() if number_spaces > 0 else 0
     return number_spaces, empty_volume, largest_volume
 
 
+def count_transitions(bin_space):
+    """
+    Counts edges between empty and non-empty cells along all three axes of a binarized space.
+    """
+    return sum(
+        np.count_nonzero(
+            np.not_equal(
+                bin_space[tuple(slice(1, None) if i == axis else slice(None) for i in range(3))],
+                bin_space[tuple(slice(None, -1) if i == axis else slice(None) for i in range(3))],
+            )
+        )
+        for axis in range(3)
+    )
+
+
 def find_open_surfaces(volume_space):
     """
     Identifies and sums all surface areas.
     A surface area is defined as the 1 cm squared edge between something (unavailable space or a package) and empty space.
     Returns an integer.
     """
-    # This is what we're searching for
-    EDGE_STRUCTURE = np.array([1, 0])
-    # Initialize counter
-    surfaces = 0
-
-    # Find matches for both the edge structure and its opposite in each dimension
-    surfaces += len(
-        np.where(
-            (binarize_space(volume_space)[:, :, :-1] == EDGE_STRUCTURE[0])
-            & (binarize_space(volume_space)[:, :, 1:] == EDGE_STRUCTURE[1])
-        )[0]
-    )
-    surfaces += len(
-        np.where(
-            (binarize_space(volume_space)[:, :, :-1] == EDGE_STRUCTURE[1])
-            & (binarize_space(volume_space)[:, :, 1:] == EDGE_STRUCTURE[0])
-        )[0]
-    )
-    surfaces += len(
-        np.where(
-            (binarize_space(volume_space)[:, :-1 ,:] == EDGE_STRUCTURE[0])
-            & (binarize_space(volume_space)[:, 1:, :] == EDGE_STRUCTURE[1])
-        )[0]
-    )
-    surfaces += len(
-        np.where(
-            (binarize_space(volume_space)[:, :-1, :] == EDGE_STRUCTURE[1])
-            & (binarize_space(volume_space)[:, 1:, :] == EDGE_STRUCTURE[0])
-        )[0]
-    )
-    surfaces += len(
-        np.where(
-            (binarize_space(volume_space)[:-1, :, :] == EDGE_STRUCTURE[0])
-            & (binarize_space(volume_space)[1:, :, :] == EDGE_STRUCTURE[1])
-        )[0]
-    )
-    surfaces += len(
-        np.where(
-            (binarize_space(volume_space)[:-1, :, :] == EDGE_STRUCTURE[1])
-            & (binarize_space(volume_space)[1:, :, :] == EDGE_STRUCTURE[0])
-        )[0]
-    )
-
-    return surfaces
+    # Binarize once, then count transitions in each dimension
+    return count_transitions(binarize_space(volume_space))
 
 
-def score_space(volume_space, article_list):
+def score_space(volume_space, article_list, space_index=None):
     """
     This function assigns a score to the empty space left by the optimization algorithm.
     There is a penalty for having more empty spaces as well as a relatively smaller largest empty space, and too many surfaces.
+    If a SpaceIndex is provided, its incrementally maintained surface count is used.
     """
     # Get number of empty spaces, their total volume and the volume of the largest empty space
     number_spaces, empty_volume, largest_volume = find_empty_space(volume_space)
@@ -241,185 +313,715 @@ def score_space(volume_space, article_list):
     score = (
         number_spaces
         + np.log(max(max_largest_volume - largest_volume, 0.001))
-        + np.log(find_open_surfaces(volume_space))
+        + np.log(
+            find_open_surfaces(volume_space) if space_index is None else space_index.surfaces
+        )
     )
     return score
 
 
+def downsample_space(bin_space, factor):
+    """
+    Reduces a binarized space by factor along each axis.
+    A coarse cell is only empty if all its cells are empty, cells beyond the edges count as occupied.
+    """
+    padded = np.pad(
+        bin_space, [(0, -size % factor) for size in bin_space.shape], constant_values=False
+    )
+    X, Y, Z = (size // factor for size in padded.shape)
+    return padded.reshape(X, factor, Y, factor, Z, factor).all(axis=(1, 3, 5))
+
+
+class SpaceScorer:
+    """
+    Scores filled spaces for a single request.
+    Per-request constants are computed once, and surfaces come from a SpaceIndex if one is given.
+    """
+
+    def __init__(self, article_list, volume_space):
+        # Get maximum possible empty space (assumes everything can be stacked perfectly)
+        self.total_package_volume = find_total_package_volume(article_list)
+        self.max_largest_volume = find_available_space(volume_space) - self.total_package_volume
+
+    def score(self, volume_space, space_index=None):
+        """
+        Returns the same score as score_space for a completely filled space.
+        """
+        number_spaces, _, largest_volume = find_empty_space(volume_space)
+        surfaces = find_open_surfaces(volume_space) if space_index is None else space_index.surfaces
+        return (
+            number_spaces
+            + np.log(max(self.max_largest_volume - largest_volume, 0.001))
+            + np.log(surfaces)
+        )
+
+
 """
 Optimizer functions
 """
 
 
-def sort_packages(article_list, sort_by="volume", direction="descending"):
-    """
-    Returns 2-dimensional list of packages sorted by sort_by in the shape of
-    [(article_code, article_id, package_id)]
-    """
-    # Initialize list
-    return_list = []
-    # Loop through articles
-    for article in article_list:
-        # If articles exist more than once, loop here too
-        for article_id in range(article[1]):
-            # Loop through packages
-            for package in article[2]:
-                # So far only sorting by volume has been implemented.
-                if sort_by == "volume":
-                    return_list.append(
-                        [
-                            article[0],
-                            article_id + 1,
-                            package[0],
-                            calculate_package_volume(package),
-                        ]
-                    )
-    # Turn into a numpy array for easier sorting
-    return_list = np.array(return_list, dtype="str")
-    # Sort by volume (4th column)
-    return_list = return_list[return_list[:, 3].astype(float).astype(int).argsort()]
-    # This gives an ascending order. Reverse if needed
+# One row per physical package, with its article as an index into article_list
+PACKAGE_DTYPE = np.dtype(
+    [
+        ("article", np.int32),
+        ("instance", np.int32),
+        ("package", np.int32),
+        ("length", np.int32),
+        ("width", np.int32),
+        ("height", np.int32),
+        ("weight", np.float32),
+        ("group", np.int32),
+    ]
+)
+
+
+def build_package_table(article_list):
+    """
+    Returns structured array (PACKAGE_DTYPE) with one row for every single package in article_list,
+    holding article index, article instance (starting at 1), package ID, dimensions, weight and group.
+    Packages with identical dimensions (in any orientation) share a group, numbered by first appearance.
+    Built once per request, so the optimizer never has to search article_list.
+    """
+    package_table = np.array(
+        [
+            (
+                article_idx,
+                article_id + 1,
+                package[0],
+                package[1],
+                package[2],
+                package[3],
+                package[4] if len(package) > 4 else 0,
+                0,
+            )
+            for article_idx, article in enumerate(article_list)
+            for article_id in range(article[1])
+            for package in article[2]
+        ],
+        dtype=PACKAGE_DTYPE,
+    ).reshape(-1)
+    # Group identical dimensions, numbered in order of first appearance
+    dimensions = np.sort(
+        np.stack((package_table["length"], package_table["width"], package_table["height"]), axis=1),
+        axis=1,
+    )
+    _, first, inverse = np.unique(dimensions, axis=0, return_index=True, return_inverse=True)
+    package_table["group"] = np.argsort(np.argsort(first))[inverse.reshape(-1)]
+    return package_table
+
+
+# Sort keys by name, each computed for the whole package table at once
+PACKAGE_SORTERS = {}
+
+
+def register_sorter(name):
+    """
+    Decorator registering a function as sorter, usable as "name|ascending" or "name|descending"
+    in GEN_SORTERS. The function receives the package table and returns one sort key per package.
+    """
+
+    def register(sorter):
+        PACKAGE_SORTERS[name] = sorter
+        return sorter
+
+    return register
+
+
+def get_package_dimensions(package_table):
+    """
+    Returns (n, 3) array of package dimensions, sorted in ascending order for each package.
+    """
+    return np.sort(
+        np.stack(
+            (package_table["length"], package_table["width"], package_table["height"]), axis=1
+        ).astype(np.int64),
+        axis=1,
+    )
+
+
+@register_sorter("volume")
+def sort_key_volume(package_table):
+    return np.prod(get_package_dimensions(package_table), axis=1)
+
+
+@register_sorter("longest_edge")
+def sort_key_longest_edge(package_table):
+    return get_package_dimensions(package_table)[:, 2]
+
+
+@register_sorter("footprint")
+def sort_key_footprint(package_table):
+    # Largest face, i.e. the footprint when placed flat
+    dimensions = get_package_dimensions(package_table)
+    return dimensions[:, 1] * dimensions[:, 2]
+
+
+@register_sorter("height")
+def sort_key_height(package_table):
+    # Smallest dimension, i.e. the height when placed flat
+    return get_package_dimensions(package_table)[:, 0]
+
+
+@register_sorter("weight")
+def sort_key_weight(package_table):
+    return package_table["weight"]
+
+
+@register_sorter("density")
+def sort_key_density(package_table):
+    return package_table["weight"] / sort_key_volume(package_table)
+
+
+def sort_packages(article_list, sort_by="volume", direction="descending", package_table=None):
+    """
+    Returns package table (see build_package_table) sorted by sort_by, one of PACKAGE_SORTERS.
+    """
+    if package_table is None:
+        package_table = build_package_table(article_list)
+    if sort_by not in PACKAGE_SORTERS:
+        raise ValueError(f"Unknown sorter {sort_by}, available: {', '.join(PACKAGE_SORTERS)}")
+    keys = PACKAGE_SORTERS[sort_by](package_table)
+    # Ascending order, keeping identical packages together. Reverse if needed
+    return_list = package_table[np.lexsort((package_table["group"], keys))]
     if direction == "descending":
         return_list = np.flip(return_list, axis=0)
-    # Remove volume column
-    return return_list[:, :3]
+    return return_list
 
 
-def hash_list(article_list):
+def hash_list(package_lists):
     """
-    Creates an element-wise list of hashes
+    Creates an element-wise list of hashes.
+    Only articles and package IDs are hashed, so orderings that merely swap copies of an article are equal.
     """
-    return [hash(article.tobytes()) for article in article_list]
+    return [
+        hash(np.stack((package_list["article"], package_list["package"])).tobytes())
+        for package_list in package_lists
+    ]
 
 
-def generate_package_lists(article_list, sorters=GEN_SORTERS, random_lists=RANDOM_LIST_COUNT):
+def log_unique_orderings(package_table, group_packages=False):
     """
-    Returns list of package lists for the optimizer.
-    Lists can be pre-defined or randomized.
+    Returns the natural log of the number of distinct orderings of package_table.
+    This is the factorial of the number of packages divided by the product of the factorials
+    for each package's count. Log-factorials keep this finite for any number of packages.
+    With group_packages, only the order of groups changes, giving the factorial of the group count.
     """
+    if group_packages:
+        return gammaln(len(np.unique(package_table["group"])) + 1)
+    _, counts = np.unique(
+        np.stack((package_table["article"], package_table["package"]), axis=1),
+        axis=0,
+        return_counts=True,
+    )
+    return gammaln(len(package_table) + 1) - np.sum(gammaln(counts + 1))
+
 
-    package_lists = []
+def shuffle_package_groups(package_table, rng):
+    """
+    Returns package_table with its groups in random order.
+    Packages within a group keep their relative order, as identical packages are interchangeable.
+    """
+    group_order = rng.permutation(np.unique(package_table["group"]))
+    # Position of each package's group in the new order, sorted stably
+    rank = np.empty(group_order.max() + 1, dtype=int)
+    rank[group_order] = np.arange(len(group_order))
+    return package_table[np.argsort(rank[package_table["group"]], kind="stable")]
+
+
+def iter_package_lists(
+    article_list,
+    sorters=GEN_SORTERS,
+    random_lists=RANDOM_LIST_COUNT,
+    rng=None,
+    group_packages=OPT_GROUP_PACKAGES,
+):
+    """
+    Yields unique package lists for the optimizer, pre-defined ones first, then random ones.
+    With group_packages, random lists keep packages with identical dimensions together
+    and only reorder the groups, as reordering identical packages leads to equivalent stackings.
+    Stops after len(sorters) + random_lists lists, or once all distinct orderings have been yielded.
+    Lists are produced lazily, so they can be streamed to the worker pool as they are needed.
+    Randomness comes from rng (a numpy.random.Generator) if given, otherwise from the global numpy state.
+    """
+    rng = np.random if rng is None else rng
+    package_table = build_package_table(article_list)
+    # Drop duplicate sorters, keeping their order so that seeded runs are reproducible
+    sorters = list(dict.fromkeys(sorters))
+    list_count = len(sorters) + random_lists
+    # Never ask for more lists than there are distinct orderings
+    log_orderings = log_unique_orderings(package_table, group_packages=group_packages)
+    if log_orderings < np.log(list_count):
+        list_count = int(np.round(np.exp(log_orderings)))
+    seen = set()
     # First generate pre-defined lists
-    sorters = set(sorters)
     for sorter in sorters:
+        if len(seen) >= list_count:
+            return
         # Split by delimiter
         sort_by, direction = sorter.split("|")
-        package_lists.append(
-            sort_packages(article_list, sort_by=sort_by, direction=direction)
+        package_list = sort_packages(
+            article_list, sort_by=sort_by, direction=direction, package_table=package_table
         )
-    # Add random lists
-    # But first check if any are needed
-    if random_lists == 0:
-        return package_lists
-    # Create starting point if there is none, i.e. no pre-defined lists
-    if len(package_lists) == 0:
-        starter_list = sort_packages(article_list)
-    else:
-        starter_list = np.copy(package_lists[0])
-
-    # What is the actual maximum number of unique lists?
-    # It's the factorial of the number of packages divided by the product of the factorials for each package's count
-    # Hoorray for high school mathematics
-    max_permut = int(np.round(fctrl(len(starter_list))/np.prod(fctrl(np.unique(np.array(starter_list)[:,0], return_counts=True)[1])),0))
-    
-    # Now add as many random lists as needed
-    while True:
-        # Shuffle starter list and copy data
-        np.random.shuffle(starter_list)
-        new_list = np.copy(starter_list)
-        # Check if this particular permutation exists already by looking at hashes
-        if hash_list([new_list])[0] not in hash_list(package_lists):
-            package_lists.append(new_list)
-        # Check if length requirement (smaller of pre-defined lists + random_lists and max_permut) is fulfilled
-        if len(package_lists) >= min(len(sorters) + random_lists, max_permut - 2):
-            break
-
-    return package_lists
-
-
-def choose_orientation(package_length, package_width, package_height, biased=False, bias_tendency=0.8):
+        list_hash = hash_list([package_list])[0]
+        if list_hash not in seen:
+            seen.add(list_hash)
+            yield package_list
+    # Then shuffle until enough random lists have been found
+    starter_list = np.copy(package_table)
+    while len(seen) < list_count:
+        if group_packages:
+            starter_list = shuffle_package_groups(package_table, rng)
+        else:
+            rng.shuffle(starter_list)
+        list_hash = hash_list([starter_list])[0]
+        if list_hash not in seen:
+            seen.add(list_hash)
+            yield np.copy(starter_list)
+
+
+def generate_package_lists(
+    article_list,
+    sorters=GEN_SORTERS,
+    random_lists=RANDOM_LIST_COUNT,
+    rng=None,
+    group_packages=OPT_GROUP_PACKAGES,
+):
+    """
+    Returns list of package lists for the optimizer.
+    Lists can be pre-defined or randomized, see iter_package_lists.
+    """
+    return list(
+        iter_package_lists(
+            article_list,
+            sorters=sorters,
+            random_lists=random_lists,
+            rng=rng,
+            group_packages=group_packages,
+        )
+    )
+
+
+def choose_orientation(package_length, package_width, package_height, biased=False, bias_tendency=0.8, rng=None):
     """
     A 3-dimensional object (with exceptions like cubes) that needs to align...
     ...with the grid can have six degrees of freedom.
     Returns one random orientation for a given package.
     Can also be biased, where package will most likely be placed as flat as possible (two largest dimensions first)
+    Randomness comes from rng (a numpy.random.Generator) if given, otherwise from the global numpy state.
     """
+    rng = np.random if rng is None else rng
     # Get dimensions
     dimensions = [package_length, package_width, package_height]
 
     # If there is a bias to the orientation
     if biased == True:
         # Check if the threshold for using the biased orientation has been reached
-        if np.random.uniform(0, 1) <= bias_tendency:
+        if rng.uniform(0, 1) <= bias_tendency:
             # Flat stacking
             return sorted(dimensions, reverse=True)
     # Otherwise, choose a truly random orientation
-    np.random.shuffle(dimensions)
+    rng.shuffle(dimensions)
     return (dimensions[0], dimensions[1], dimensions[2])
 
 
-def find_first_space(package_x, package_y, package_z, volume_space):
+def get_orientations(package_length, package_width, package_height):
+    """
+    Returns all distinct orientations (up to six) of a package.
+    Flattest orientations come first, with the longest dimension along x.
+    """
+    orientations = set(itertools.permutations((package_length, package_width, package_height)))
+    return sorted(orientations, key=lambda orientation: (orientation[2], -orientation[0]))
+
+
+def choose_layer_orientations(package_length, package_width, package_height, biased=False, bias_tendency=0.8, rng=None):
+    """
+    Returns the orientations a layer or wall of identical packages may use.
+    Follows choose_orientation: with a bias, the packages will most likely be placed as flat as possible,
+    i.e. only with their smallest dimension upright. Otherwise all orientations are allowed.
+    """
+    rng = np.random if rng is None else rng
+    orientations = get_orientations(package_length, package_width, package_height)
+    if biased and rng.uniform(0, 1) <= bias_tendency:
+        return [orientation for orientation in orientations if orientation[2] == orientations[0][2]]
+    return orientations
+
+
+class SpaceIndex:
+    """
+    Persistent index of free space in volume_space, kept up to date by place_package.
+    Holds the binarized space, a 3D summed-area table of occupied cells and a list of
+    extreme points, i.e. the corners next to already placed packages where the next
+    package is most likely to go.
+    The summed-area table makes checking whether a box is empty an O(1) lookup,
+    so all starting coordinates can be tested in a single vectorized expression.
+    """
+
+    def __init__(self, volume_space):
+        # Binarize once - empty areas shown as True
+        self.bin_space = binarize_space(volume_space)
+        # Summed-area table of occupied cells, padded with zeros at the start of each axis.
+        # occupied_sum[i, j, k] is the number of occupied cells in bin_space[:i, :j, :k]
+        self.occupied_sum = np.zeros(
+            np.add(self.bin_space.shape, 1), dtype=np.int32
+        )
+        self.occupied_sum[1:, 1:, 1:] = (
+            (~self.bin_space).cumsum(0, dtype=np.int32).cumsum(1).cumsum(2)
+        )
+        # Stacking starts from the origin corner of the trunk
+        self.extreme_points = [(0, 0, 0)]
+        # Undo log of placed packages and the extreme points before each placement
+        self.undo_log = []
+        # Number of open surfaces, kept up to date with every placement
+        self.surfaces = count_transitions(self.bin_space)
+
+    def project_point(self, x, y, z):
+        """
+        Moves a point down (z), then back (x), then sideways (y) until it rests on something.
+        """
+        z = self._slide(self.bin_space[x, y, :z][::-1], z)
+        x = self._slide(self.bin_space[:x, y, z][::-1], x)
+        y = self._slide(self.bin_space[x, :y, z][::-1], y)
+        return x, y, z
+
+    @staticmethod
+    def _slide(line, position):
+        """
+        Returns new position after sliding along line (ordered away from position) while space is empty.
+        """
+        blocked = np.flatnonzero(~line)
+        if len(blocked) == 0:
+            return 0
+        return position - blocked[0]
+
+    def box_sums(self, package_x, package_y, package_z):
+        """
+        Returns number of occupied cells a package would overlap for every possible starting coordinate.
+        Resulting array has one element per valid starting coordinate in each dimension.
+        """
+        S = self.occupied_sum
+        a, b, c = package_x, package_y, package_z
+        # Inclusion-exclusion over the eight corners of each box
+        return (
+            S[a:, b:, c:]
+            - S[:-a, b:, c:]
+            - S[a:, :-b, c:]
+            - S[a:, b:, :-c]
+            + S[:-a, :-b, c:]
+            + S[:-a, b:, :-c]
+            + S[a:, :-b, :-c]
+            - S[:-a, :-b, :-c]
+        )
+
+    def point_sums(self, points, package_x, package_y, package_z):
+        """
+        Returns number of occupied cells a package would overlap for each of the given starting coordinates.
+        Points must be within bounds, i.e. point + package dimensions <= shape.
+        Package dimensions may also be arrays of shape (m, 1) to evaluate m orientations at once.
+        """
+        S = self.occupied_sum
+        x0, y0, z0 = points[:, 0], points[:, 1], points[:, 2]
+        x1, y1, z1 = x0 + package_x, y0 + package_y, z0 + package_z
+        return (
+            S[x1, y1, z1]
+            - S[x0, y1, z1]
+            - S[x1, y0, z1]
+            - S[x1, y1, z0]
+            + S[x0, y0, z1]
+            + S[x0, y1, z0]
+            + S[x1, y0, z0]
+            - S[x0, y0, z0]
+        )
+
+    def fits(self, package_x, package_y, package_z):
+        """
+        Returns True if the package dimensions do not exceed the space itself.
+        """
+        return all(
+            dimension <= size
+            for dimension, size in zip((package_x, package_y, package_z), self.bin_space.shape)
+        )
+
+    def _set_occupancy(self, x, y, z, package_x, package_y, package_z, empty):
+        """
+        Sets a package's cells to empty (True) or occupied (False) and updates the surface count.
+        Only edges within one cell of the package can change.
+        """
+        window = self.bin_space[
+            max(x - 1, 0) : x + package_x + 1,
+            max(y - 1, 0) : y + package_y + 1,
+            max(z - 1, 0) : z + package_z + 1,
+        ]
+        before = count_transitions(window)
+        self.bin_space[x : x + package_x, y : y + package_y, z : z + package_z] = empty
+        self.surfaces += count_transitions(window) - before
+
+    def _update_occupied_sum(self, x, y, z, package_x, package_y, package_z, sign):
+        """
+        Adds (sign=1) or removes (sign=-1) a package from the summed-area table.
+        Every prefix sum beyond the package start changes by its overlap with the package.
+        """
+        X, Y, Z = self.bin_space.shape
+        overlap_x = np.minimum(np.arange(x + 1, X + 1), x + package_x) - x
+        overlap_y = np.minimum(np.arange(y + 1, Y + 1), y + package_y) - y
+        overlap_z = np.minimum(np.arange(z + 1, Z + 1), z + package_z) - z
+        self.occupied_sum[x + 1 :, y + 1 :, z + 1 :] += (
+            sign * overlap_x[:, None, None] * overlap_y[None, :, None] * overlap_z[None, None, :]
+        ).astype(np.int32)
+
+    def occupy_box(self, x, y, z, package_x, package_y, package_z):
+        """
+        Marks a box as occupied in binarized space, summed-area table and surface count.
+        """
+        self._set_occupancy(x, y, z, package_x, package_y, package_z, False)
+        self._update_occupied_sum(x, y, z, package_x, package_y, package_z, 1)
+
+    def vacate_box(self, x, y, z, package_x, package_y, package_z):
+        """
+        Marks a previously occupied box as empty in binarized space, summed-area table and surface count.
+        """
+        self._set_occupancy(x, y, z, package_x, package_y, package_z, True)
+        self._update_occupied_sum(x, y, z, package_x, package_y, package_z, -1)
+
+    def slide_box(self, x, y, z, package_x, package_y, package_z):
+        """
+        Moves an occupied box down (z), then back (x), then sideways (y) as far as it can go.
+        Returns the new starting coordinates.
+        """
+        self.vacate_box(x, y, z, package_x, package_y, package_z)
+        position = [x, y, z]
+        for axis in (2, 0, 1):
+            # Every position between the axis origin and the current one
+            points = np.repeat([position], position[axis] + 1, axis=0)
+            points[:, axis] = np.arange(position[axis] + 1)
+            blocked = np.flatnonzero(self.point_sums(points, package_x, package_y, package_z) > 0)
+            if len(blocked) > 0:
+                position[axis] = int(blocked[-1]) + 1
+            else:
+                position[axis] = 0
+        self.occupy_box(*position, package_x, package_y, package_z)
+        return tuple(position)
+
+    def add_package(self, x, y, z, package_x, package_y, package_z):
+        """
+        Marks package as occupied and updates summed-area table and extreme points.
+        The placement is recorded in the undo log.
+        """
+        self.undo_log.append(((x, y, z, package_x, package_y, package_z), self.extreme_points))
+        self.occupy_box(x, y, z, package_x, package_y, package_z)
+        # Drop points now covered by the package
+        points = [
+            point
+            for point in self.extreme_points
+            if not (
+                x <= point[0] < x + package_x
+                and y <= point[1] < y + package_y
+                and z <= point[2] < z + package_z
+            )
+        ]
+        # Add the three corners adjacent to the package
+        for point in [
+            (x + package_x, y, z),
+            (x, y + package_y, z),
+            (x, y, z + package_z),
+        ]:
+            # Ignore anything outside the volume or not empty
+            if any(point[i] >= self.bin_space.shape[i] for i in range(3)):
+                continue
+            if not self.bin_space[point]:
+                continue
+            point = self.project_point(*point)
+            if point not in points:
+                points.append(point)
+        self.extreme_points = points
+
+    def add_layer(self, x, y, z, package_x, package_y, package_z, counts):
+        """
+        Marks a block of counts (along x, y, z) identical packages as occupied in one update.
+        Each package gets its own entry in the undo log, so they can be removed one at a time.
+        Returns the starting coordinates of each package.
+        """
+        extreme_points = self.extreme_points
+        self.add_package(
+            x, y, z, package_x * counts[0], package_y * counts[1], package_z * counts[2]
+        )
+        self.undo_log.pop()
+        starts = [
+            (x + i * package_x, y + j * package_y, z + k * package_z)
+            for i, j, k in np.ndindex(*counts)
+        ]
+        self.undo_log.extend(
+            (start + (package_x, package_y, package_z), extreme_points) for start in starts
+        )
+        return starts
+
+    def remove_package(self):
+        """
+        Undoes the most recent placement.
+        Returns the removed package's starting coordinates and dimensions.
+        """
+        package, self.extreme_points = self.undo_log.pop()
+        self.vacate_box(*package)
+        return package
+
+    def find_extreme_point(self, package_x, package_y, package_z, axes=PLACEMENT_RULES[OPT_PLACEMENT_RULE]):
+        """
+        Returns the first extreme point where the package fits.
+        Points are compared along axes in the given order, by default in z, x, y order.
+        """
+        points = np.array(self.extreme_points, dtype=int).reshape(-1, 3)
+        # Only keep points where the package stays within bounds
+        points = points[
+            np.all(points + (package_x, package_y, package_z) <= self.bin_space.shape, axis=1)
+        ]
+        # Sort in stacking order
+        points = points[np.lexsort((points[:, axes[2]], points[:, axes[1]], points[:, axes[0]]))]
+        empty = np.flatnonzero(self.point_sums(points, package_x, package_y, package_z) == 0)
+        if len(empty) == 0:
+            return OPT_INSUFFICIENT_SPACE
+        return tuple(int(i) for i in points[empty[0]])
+
+    def find_first_space(self, package_x, package_y, package_z, axes=PLACEMENT_RULES[OPT_PLACEMENT_RULE]):
+        """
+        Returns the first starting coordinate across the entire space where the package fits.
+        Coordinates are compared along axes in the given order, by default in z, x, y order.
+        """
+        if not self.fits(package_x, package_y, package_z):
+            return OPT_INSUFFICIENT_SPACE
+        # Transpose so that flattened order matches stacking order
+        empty = (self.box_sums(package_x, package_y, package_z) == 0).transpose(axes)
+        first = np.argmax(empty)
+        if not empty.flat[first]:
+            return OPT_INSUFFICIENT_SPACE
+        position = [0, 0, 0]
+        for axis, coordinate in zip(axes, np.unravel_index(first, empty.shape)):
+            position[axis] = int(coordinate)
+        return tuple(position)
+
+    def find_best_space(self, orientations, axes=PLACEMENT_RULES[OPT_PLACEMENT_RULE]):
+        """
+        Evaluates all orientations of a package at once and returns the best (orientation, position) pair.
+        Positions are compared along axes in the given order, ties go to the earlier orientation.
+        Extreme points are tried first before scanning the entire space.
+        """
+        orientations = np.array(orientations, dtype=int).reshape(-1, 3)
+        points = np.array(self.extreme_points, dtype=int).reshape(-1, 3)
+        # Every combination of orientation (rows) and extreme point (columns)
+        ends = points[None, :, :] + orientations[:, None, :]
+        inside = np.all(ends <= self.bin_space.shape, axis=2)
+        # Out of bounds combinations are evaluated on a dummy package and masked out
+        dimensions = np.where(inside[:, :, None], orientations[:, None, :], 0)
+        empty = inside & (
+            self.point_sums(points, dimensions[:, :, 0], dimensions[:, :, 1], dimensions[:, :, 2]) == 0
+        )
+        if empty.any():
+            orientation_idx, point_idx = np.nonzero(empty)
+            keys = points[point_idx][:, list(axes)]
+            best = np.lexsort((orientation_idx, keys[:, 2], keys[:, 1], keys[:, 0]))[0]
+            return (
+                tuple(int(i) for i in orientations[orientation_idx[best]]),
+                tuple(int(i) for i in points[point_idx[best]]),
+            )
+        # Otherwise find first position for each orientation across the entire space
+        best = None
+        for orientation in orientations:
+            position = self.find_first_space(*orientation, axes=axes)
+            if position == OPT_INSUFFICIENT_SPACE:
+                continue
+            key = tuple(position[axis] for axis in axes)
+            if best is None or key < best[0]:
+                best = (key, tuple(int(i) for i in orientation), position)
+        if best is None:
+            return OPT_INSUFFICIENT_SPACE
+        return best[1], best[2]
+
+    def find_best_layer(self, orientations, max_count, axes=PLACEMENT_RULES[OPT_PLACEMENT_RULE]):
+        """
+        Finds the largest block of up to max_count identical packages that fits at an extreme point.
+        Blocks are 2D tilings, either layers (one package high) or walls (one package deep).
+        Ties go to the better position according to axes, then to the flatter block,
+        then to the earlier orientation.
+        Returns orientation, counts along x, y, z and starting coordinates, or an error code
+        if no block of at least two packages fits.
+        """
+        points = np.array(self.extreme_points, dtype=int).reshape(-1, 3)
+        shape = self.bin_space.shape
+        candidates = []
+        for orientation_idx, (package_x, package_y, package_z) in enumerate(orientations):
+            # Layers tile x and y, walls tile y and z
+            for first_axis, package_first in ((0, package_x), (2, package_z)):
+                max_first = min(shape[first_axis] // package_first, max_count)
+                for count_first in range(1, max_first + 1):
+                    for count_y in range(1, min(shape[1] // package_y, max_count // count_first) + 1):
+                        counts = [1, count_y, 1]
+                        counts[first_axis] = count_first
+                        if count_first * count_y > 1:
+                            candidates.append((orientation_idx, *counts))
+        if len(candidates) == 0:
+            return OPT_INSUFFICIENT_SPACE
+        candidates = np.array(candidates, dtype=int)
+        orientations = np.array(orientations, dtype=int).reshape(-1, 3)
+        block_dimensions = orientations[candidates[:, 0]] * candidates[:, 1:]
+        # Every combination of block (rows) and extreme point (columns)
+        inside = np.all(points[None, :, :] + block_dimensions[:, None, :] <= shape, axis=2)
+        dimensions = np.where(inside[:, :, None], block_dimensions[:, None, :], 0)
+        empty = inside & (
+            self.point_sums(points, dimensions[:, :, 0], dimensions[:, :, 1], dimensions[:, :, 2]) == 0
+        )
+        if not empty.any():
+            return OPT_INSUFFICIENT_SPACE
+        block_idx, point_idx = np.nonzero(empty)
+        keys = points[point_idx][:, list(axes)]
+        best = np.lexsort(
+            (
+                candidates[block_idx, 0],
+                block_dimensions[block_idx, 2],
+                keys[:, 2],
+                keys[:, 1],
+                keys[:, 0],
+                -np.prod(candidates[block_idx, 1:], axis=1),
+            )
+        )[0]
+        return (
+            tuple(int(i) for i in orientations[candidates[block_idx[best], 0]]),
+            tuple(int(i) for i in candidates[block_idx[best], 1:]),
+            tuple(int(i) for i in points[point_idx[best]]),
+        )
+
+
+def find_first_space(package_x, package_y, package_z, volume_space, space_index=None):
     """
     Finds first suitable space for package dimensions.
+    If a SpaceIndex is provided, its extreme points are tried first before scanning the entire space,
+    otherwise a temporary index is built.
     Returns x,y,z starting coordinates.
     """
-    # Binarize volume space - empty areas shown as ones
-    bin_space = binarize_space(volume_space)
+    if space_index is None:
+        space_index = SpaceIndex(volume_space)
+    else:
+        return_value = space_index.find_extreme_point(package_x, package_y, package_z)
+        if return_value != OPT_INSUFFICIENT_SPACE:
+            return return_value
+    return space_index.find_first_space(package_x, package_y, package_z)
+
 
-    start_time = time.time()
-    # Original shape
-    orig_x, orig_y, orig_z = bin_space.shape
-    # Find all occurrences in all three dimensions where package COULD fit.
-    # That is, where the first and nth (as defined by the package_ dimensions) element are ones, i.e. empty.
-    # It's not ideal but a good enough approximation.
-    # The slicing at the end makes sure the arrays have the same dimensions, which is important for the following np.where step.
-    potential_x = ((bin_space[int(np.floor(package_x/2)):-int(np.ceil(package_x/2)),:,:] == 1) & (bin_space[:-package_x,:,:] == 1) & (bin_space[package_x:,:,:] == 1))[:orig_x-package_x,:orig_y-package_y,:orig_z-package_z]
-    potential_y = ((bin_space[:,int(np.floor(package_y/2)):-int(np.ceil(package_y/2)),:] == 1) & (bin_space[:,:-package_y,:] == 1) & (bin_space[:,package_y:,:] == 1))[:orig_x-package_x,:orig_y-package_y,:orig_z-package_z]
-    potential_z = ((bin_space[:,:,int(np.floor(package_z/2)):-int(np.ceil(package_z/2))] == 1) & (bin_space[:,:,:-package_z] == 1) & (bin_space[:,:,package_z:] == 1))[:orig_x-package_x,:orig_y-package_y,:orig_z-package_z]
-    #print(f"Occurrence search {time.time()-start_time}")
-    # Find all matches between the three dimensions searched in.
-    potentials = np.transpose(np.nonzero((potential_x == potential_y) & (potential_x == potential_z) & potential_x))
-    # Now sort along the three dimensions/axes to ensure we stack from the correct corner of the trunk.
-    potentials = potentials[np.lexsort((potentials[:,1], potentials[:,0], potentials[:,2])), :]
-    #print(f"Identify potentials {time.time()-start_time}")
-    # Loop through one by one until we find an appropriate solution
-    i = 0
-    for potential in potentials:
-        x,y,z = potential
-        i += 1
-        # Verify if entire space is empty
-        test_section = bin_space[x:x+package_x, y:y+package_y, z:z+package_z]
-        if np.all(test_section == 1) and (test_section.shape == (package_x, package_y, package_z)):
-            #print(f"Done. This took {time.time()-start_time}. (Attempt {i})")
-            return x,y,z
-    return OPT_INSUFFICIENT_SPACE
-
-
-def place_package(package_dimensions, volume_space):
+def find_best_space(orientations, volume_space, space_index=None, placement_rule=OPT_PLACEMENT_RULE):
     """
-    Attempt to place next package.
-    If successful, return filled volume_space and start/end coordinates,
-    if not, return error code.
+    Finds best suitable space across all given orientations of a package.
+    Positions are ranked by placement_rule as defined in params.py.
+    If no SpaceIndex is provided, a temporary index is built.
+    Returns orientation and x,y,z starting coordinates.
+    """
+    if space_index is None:
+        space_index = SpaceIndex(volume_space)
+    return space_index.find_best_space(orientations, axes=PLACEMENT_RULES[placement_rule])
+
+
+def fill_package(volume_space, x, y, z, package_x, package_y, package_z):
+    """
+    Populates volume_space with a package starting at x,y,z.
+    Package surfaces are set to VOL_BORDER, its interior to VOL_INTERIOR.
     """
-    # Unpack package dimensions
-    package_x, package_y, package_z = package_dimensions
-    package_volume = calculate_package_volume(package_dimensions)
-    # Find space for package
-    return_value = find_first_space(package_x, package_y, package_z, volume_space)
-    # Check for error codes
-    if return_value == OPT_INSUFFICIENT_SPACE:
-        return OPT_INSUFFICIENT_SPACE
-    x, y, z = return_value
-    # Check available space - there need to be as many zeros as the package_volume for it to fit
-    available_space = volume_space[
-        x : x + package_x, y : y + package_y, z : z + package_z
-    ]
-    # If the package cannot be placed, return
-    if package_volume != available_space.size - np.count_nonzero(
-        binarize_space(binarize_space(available_space))
-    ):
-        return OPT_INSUFFICIENT_SPACE
-    # Otherwise populate the array
     # Surfaces first
     # z-plane
     volume_space[x : x + package_x, y : y + package_y, z] = VOL_BORDER
@@ -435,6 +1037,68 @@ def place_package(package_dimensions, volume_space):
         x + 1 : x + package_x - 1, y + 1 : y + package_y - 1, z + 1 : z + package_z - 1
     ] = VOL_INTERIOR
 
+
+def fill_space(volume_space, package_coordinates):
+    """
+    Rebuilds a filled volume_space from package coordinates as returned by the optimizer.
+    Returns the filled volume_space.
+    """
+    for coordinates in package_coordinates:
+        x_start, y_start, z_start, x_end, y_end, z_end = coordinates[3:9]
+        fill_package(
+            volume_space,
+            x_start,
+            y_start,
+            z_start,
+            x_end - x_start + 1,
+            y_end - y_start + 1,
+            z_end - z_start + 1,
+        )
+    return volume_space
+
+
+def place_package(package_dimensions, volume_space, space_index=None, placement_rule=None):
+    """
+    Attempt to place next package.
+    If a placement_rule is given, all orientations of the package are evaluated and the best
+    position is chosen according to the rule, otherwise package_dimensions are used as they are.
+    If successful, return filled volume_space and start/end coordinates,
+    if not, return error code.
+    If a SpaceIndex is provided, it is updated with the placed package.
+    """
+    # Find space for package
+    if placement_rule is None:
+        return_value = find_first_space(*package_dimensions, volume_space, space_index=space_index)
+    else:
+        return_value = find_best_space(
+            get_orientations(*package_dimensions),
+            volume_space,
+            space_index=space_index,
+            placement_rule=placement_rule,
+        )
+    # Check for error codes
+    if return_value == OPT_INSUFFICIENT_SPACE:
+        return OPT_INSUFFICIENT_SPACE
+    if placement_rule is None:
+        x, y, z = return_value
+    else:
+        package_dimensions, (x, y, z) = return_value
+    # Unpack package dimensions
+    package_x, package_y, package_z = package_dimensions
+    package_volume = calculate_package_volume(package_dimensions)
+    # Check available space - there need to be as many empty cells as the package_volume for it to fit
+    available_space = volume_space[
+        x : x + package_x, y : y + package_y, z : z + package_z
+    ]
+    # If the package cannot be placed, return
+    if package_volume != np.count_nonzero(binarize_space(available_space)):
+        return OPT_INSUFFICIENT_SPACE
+    # Otherwise populate the array
+    fill_package(volume_space, x, y, z, package_x, package_y, package_z)
+    # Keep free space index in sync
+    if space_index is not None:
+        space_index.add_package(x, y, z, package_x, package_y, package_z)
+
     return (
         volume_space,
         x,
@@ -446,20 +1110,69 @@ def place_package(package_dimensions, volume_space):
     )
 
 
-def optimizer(
+def find_group_runs(package_list):
+    """
+    Returns for each package the number of consecutive packages of the same group starting with it.
+    """
+    runs = np.ones(len(package_list), dtype=int)
+    for i in range(len(package_list) - 2, -1, -1):
+        if package_list["group"][i] == package_list["group"][i + 1]:
+            runs[i] = runs[i + 1] + 1
+    return runs
+
+
+def unplace_package(volume_space, space_index):
+    """
+    Removes the most recently placed package recorded in space_index.
+    Returns emptied volume_space.
+    """
+    x, y, z, package_x, package_y, package_z = space_index.remove_package()
+    volume_space[x : x + package_x, y : y + package_y, z : z + package_z] = VOL_EMPTY
+    return volume_space
+
+
+def is_cancelled(deadline=None, cancel_event=None):
+    """
+    Returns True if deadline (a time.time() value) has passed or cancel_event has been set.
+    """
+    if deadline is not None and time.time() > deadline:
+        return True
+    return cancel_event is not None and cancel_event.is_set()
+
+
+def stack_packages(
     package_list,
     article_list,
-    volume_space,
-    empty_space,
-    queue=None,
+    new_space,
     max_attempts=OPT_MAX_ATTEMPTS,
     biased=True,
     bias_tendency=0.8,
+    deadline=None,
+    cancel_event=None,
+    backtrack_depth=OPT_BACKTRACK_DEPTH,
+    placement_rule=None,
+    rng=None,
+    layer_min_packages=0,
 ):
     """
-    Places packages sequentially into available space.
+    Places packages sequentially into a space, shared by the voxel and the geometry engine.
+    new_space is called to get an empty space, e.g. a SpaceIndex or a BoxSpace, which finds positions
+    with find_best_space and places and removes packages with add_package and remove_package.
+    package_list is a package table as returned by sort_packages, in the order of placement.
+    Random orientations are drawn from rng (a numpy.random.Generator) if given.
+    Without a placement_rule, each package gets a random (possibly biased) orientation.
+    With a placement_rule, all orientations are evaluated and the best position is chosen
+    according to the rule, which makes runs deterministic. Random orientations are then
+    only used for packages placed again after backtracking, or after starting over.
     If at any point a package can no longer be placed, try again up to max_attempts times.
-    Returns score, attempts taken, filled volume_space and package coordinates.
+    With backtrack_depth > 0, a retry first only undoes the last backtrack_depth placements
+    and places those packages again in random orientations. Only if that fails again
+    at the same point or earlier does it start over from scratch.
+    Runs of at least layer_min_packages identical packages are first placed as layers or walls,
+    in the orientations the bias allows (see choose_layer_orientations), which needs
+    find_best_layer and add_layer of a SpaceIndex. The rest of a run is placed one package at a time.
+    Gives up once deadline (a time.time() value) has passed or cancel_event is set.
+    Returns attempts taken, the space and package coordinates.
     """
     # Attempts taken
     attempts_counter = 1
@@ -467,81 +1180,535 @@ def optimizer(
     package_counter = 0
     # Package coordinates
     package_coordinates = []
+    space = new_space()
+    # Package that could not be placed during last backtrack, if any
+    backtrack_failure = None
+    # Evaluate all orientations until the first restart
+    enumerate_orientations = placement_rule is not None
+    axes = PLACEMENT_RULES[placement_rule or OPT_PLACEMENT_RULE]
+    # Number of identical packages following each package
+    group_runs = find_group_runs(package_list)
     # Loop while there are still packages to place
-    while True:
-        #print(f"attempts_counter {attempts_counter}")
-        # Pick up first package
+    while package_counter < len(package_list):
+        # Stop if the result is no longer needed
+        if is_cancelled(deadline, cancel_event):
+            return OPT_UNSUCCESSFUL
+        # Pick up next package, its dimensions are part of the package table row
         package = package_list[package_counter]
-        # Find article index
-        idx = sum(
-            [i for i, article in enumerate(article_list) if article[0] == package[0]]
-        )
-        # Get package dimensions: Looks up article by its index (idx),
-        # package definitions are the 3rd element (2),
-        # packages are listed, so it's the n-1th element.
-        pkg = article_list[idx][2][int(package[2]) - 1]
-        package_length, package_width, package_height = pkg[1], pkg[2], pkg[3]
-        # Obtain package orientation (random)
-        package_dimensions = choose_orientation(
-            package_length,
-            package_width,
-            package_height,
-            biased=biased,
-            bias_tendency=bias_tendency,
+        package_dimensions = (
+            int(package["length"]),
+            int(package["width"]),
+            int(package["height"]),
         )
-        # Attempt to place package in space
-        placement_result = place_package(package_dimensions, volume_space)
+        # Packages placed again after backtracking try alternate orientations
+        retrying = backtrack_failure is not None and package_counter <= backtrack_failure
+        # Starting coordinates and orientation of each package placed in this step
+        placements = None
+        # Place identical packages as a block if there are enough of them
+        if 0 < layer_min_packages <= group_runs[package_counter] and not retrying:
+            if enumerate_orientations:
+                orientations = get_orientations(*package_dimensions)
+            else:
+                # Only orientations the bias allows for single packages as well
+                orientations = choose_layer_orientations(
+                    *package_dimensions, biased=biased, bias_tendency=bias_tendency, rng=rng
+                )
+            layer_result = space.find_best_layer(orientations, group_runs[package_counter], axes=axes)
+            if layer_result != OPT_INSUFFICIENT_SPACE:
+                orientation, counts, position = layer_result
+                starts = space.add_layer(*position, *orientation, counts)
+                placements = [(start, orientation) for start in starts]
+        if placements is None:
+            if enumerate_orientations and not retrying:
+                # Attempt to place package in space in its best orientation
+                orientations = get_orientations(*package_dimensions)
+            else:
+                # Obtain package orientation (random)
+                orientations = [
+                    choose_orientation(
+                        *package_dimensions,
+                        biased=biased and not retrying,
+                        bias_tendency=bias_tendency,
+                        rng=rng,
+                    )
+                ]
+            placement_result = space.find_best_space(orientations, axes=axes)
+            if placement_result != OPT_INSUFFICIENT_SPACE:
+                orientation, position = placement_result
+                space.add_package(*position, *orientation)
+                placements = [(position, orientation)]
         # Check if placement was successful
-        if placement_result != OPT_INSUFFICIENT_SPACE:
-            # Extract return variables and append to package_coordinates
-            (
-                volume_space,
-                x_start,
-                y_start,
-                z_start,
-                x_end,
-                y_end,
-                z_end,
-            ) = placement_result
-            return_list = [
-                package[0],
-                package[1],
-                package[2],
-                x_start,
-                y_start,
-                z_start,
-                x_end,
-                y_end,
-                z_end,
-            ]
-            package_coordinates.append(return_list)
+        if placements is not None:
+            for (x, y, z), (package_x, package_y, package_z) in placements:
+                package = package_list[package_counter]
+                package_coordinates.append(
+                    [
+                        article_list[package["article"]][0],
+                        int(package["instance"]),
+                        int(package["package"]),
+                        x,
+                        y,
+                        z,
+                        x + package_x - 1,
+                        y + package_y - 1,
+                        z + package_z - 1,
+                    ]
+                )
+                # Increase counter to move to next package
+                package_counter += 1
+            continue
+        # If unsuccessful, increase counter of attempts taken
+        attempts_counter += 1
+        # See if this is too many attempts already
+        if attempts_counter > max_attempts:
+            return OPT_UNSUCCESSFUL
+        elif (
+            backtrack_depth > 0
+            and package_counter > 0
+            and (backtrack_failure is None or package_counter > backtrack_failure)
+        ):
+            # Try again from a few packages back
+            backtrack_failure = package_counter
+            for _ in range(min(backtrack_depth, package_counter)):
+                space.remove_package()
+                package_coordinates.pop()
+                package_counter -= 1
         else:
-            # If unsuccessful, increase counter of attempts taken
-            attempts_counter += 1
-            # See if this is too many attempts already
-            if attempts_counter > max_attempts:
-                # print("max attempts reached")
-                # Return error code
-                if queue is not None:
-                    queue.put(OPT_UNSUCCESSFUL)
-                return OPT_UNSUCCESSFUL
-            else:
-                # Try again
-                package_counter = 0
-                package_coordinates = []
-                volume_space = np.copy(empty_space)
+            # Try again from scratch, this time with random orientations
+            backtrack_failure = None
+            enumerate_orientations = False
+            package_counter = 0
+            package_coordinates = []
+            space = new_space()
+    return attempts_counter, space, package_coordinates
+
+
+def optimizer(
+    package_list,
+    article_list,
+    volume_space,
+    empty_space,
+    queue=None,
+    max_attempts=OPT_MAX_ATTEMPTS,
+    biased=True,
+    bias_tendency=0.8,
+    deadline=None,
+    cancel_event=None,
+    backtrack_depth=OPT_BACKTRACK_DEPTH,
+    placement_rule=None,
+    rng=None,
+    scorer=None,
+    layer_min_packages=OPT_LAYER_MIN_PACKAGES,
+):
+    """
+    Places packages sequentially into available space, tracked by a SpaceIndex.
+    Orientations, retries, backtracking and layers are handled by stack_packages.
+    volume_space is filled with the final stacking, which is scored by scorer,
+    created from empty_space if not given.
+    Returns score, attempts taken, filled volume_space and package coordinates.
+    """
+    # Scorer with constants for this request
+    if scorer is None:
+        scorer = SpaceScorer(article_list, empty_space)
+    result = stack_packages(
+        package_list,
+        article_list,
+        lambda: SpaceIndex(empty_space),
+        max_attempts=max_attempts,
+        biased=biased,
+        bias_tendency=bias_tendency,
+        deadline=deadline,
+        cancel_event=cancel_event,
+        backtrack_depth=backtrack_depth,
+        placement_rule=placement_rule,
+        rng=rng,
+        layer_min_packages=layer_min_packages,
+    )
+    if result == OPT_UNSUCCESSFUL:
+        if queue is not None:
+            queue.put(OPT_UNSUCCESSFUL)
+        return OPT_UNSUCCESSFUL
+    attempts_counter, space_index, package_coordinates = result
+    # Fill stacking in one go, the space index already holds its occupancy
+    volume_space = fill_space(volume_space, package_coordinates)
+    # Score stacking
+    score = scorer.score(volume_space, space_index=space_index)
+    # Return
+    if queue is not None:
+        queue.put((score, attempts_counter, volume_space, package_coordinates))
+    return score, attempts_counter, volume_space, package_coordinates
+
+
+"""
+Improvement functions
+"""
+
+
+def get_solution(package_coordinates, article_list):
+    """
+    Returns package list (a package table in placement order) and package orientations
+    of a stacking given by its package coordinates.
+    """
+    package_table = build_package_table(article_list)
+    rows = {
+        (article_list[package["article"]][0], int(package["instance"]), int(package["package"])): i
+        for i, package in enumerate(package_table)
+    }
+    package_list = package_table[[rows[tuple(coordinates[:3])] for coordinates in package_coordinates]]
+    orientations = [
+        tuple(int(end) - int(start) + 1 for start, end in zip(coordinates[3:6], coordinates[6:9]))
+        for coordinates in package_coordinates
+    ]
+    return package_list, orientations
+
+
+def place_sequence(package_list, orientations, start, volume_space, space_index, package_coordinates):
+    """
+    Undoes all placements from position start onwards, then places the remaining packages
+    of package_list in the given orientations. package_coordinates is updated in place.
+    Returns True if all packages could be placed.
+    """
+    while len(package_coordinates) > start:
+        unplace_package(volume_space, space_index)
+        package_coordinates.pop()
+    for package, orientation in zip(package_list[start:], orientations[start:]):
+        placement_result = place_package(orientation, volume_space, space_index=space_index)
+        if placement_result == OPT_INSUFFICIENT_SPACE:
+            return False
+        package_coordinates.append([package, *placement_result[1:]])
+    return True
+
+
+def mutate_solution(package_list, orientations, rng):
+    """
+    Applies a random move to a solution: swapping two packages, moving one package
+    to another position, or rotating one package.
+    Returns new package list and orientations, and the first position that changed.
+    """
+    package_list, orientations = np.copy(package_list), list(orientations)
+    move = rng.integers(3) if len(package_list) > 1 else 2
+    if move == 0:
+        # Swap
+        i, j = sorted(rng.choice(len(package_list), 2, replace=False))
+        package_list[[i, j]] = package_list[[j, i]]
+        orientations[i], orientations[j] = orientations[j], orientations[i]
+    elif move == 1:
+        # Reinsert
+        i, j = rng.choice(len(package_list), 2, replace=False)
+        order = list(range(len(package_list)))
+        order.insert(j, order.pop(i))
+        package_list = package_list[order]
+        orientations = [orientations[k] for k in order]
+        i = min(i, j)
+    else:
+        # Rotate
+        i = rng.integers(len(package_list))
+        alternatives = [o for o in get_orientations(*orientations[i]) if o != orientations[i]]
+        if alternatives:
+            orientations[i] = alternatives[rng.integers(len(alternatives))]
+    return package_list, orientations, int(i)
+
+
+def improve_solution(
+    package_list,
+    orientations,
+    article_list,
+    volume_space,
+    time_limit,
+    rng=None,
+    scorer=None,
+    temperatures=OPT_IMPROVE_TEMPERATURES,
+    deadline=None,
+):
+    """
+    Improves a solution by simulated annealing for time_limit seconds, or until deadline
+    (a time.time() value) if that comes first.
+    Each step swaps, moves or rotates packages and places the packages from the first changed
+    position onwards again, keeping all earlier placements. Worse solutions are accepted with
+    a probability that shrinks as the temperature cools from temperatures[0] to temperatures[1].
+    Returns best score and package coordinates found, or an error code if the solution cannot
+    be placed in the first place or the deadline has already passed.
+    """
+    begin_time = time.time()
+    end_time = begin_time + time_limit if deadline is None else min(begin_time + time_limit, deadline)
+    if end_time <= begin_time:
+        return OPT_TIME_BUDGET_EXCEEDED
+    rng = np.random.default_rng() if rng is None else rng
+    if scorer is None:
+        scorer = SpaceScorer(article_list, volume_space)
+    volume_space = np.copy(volume_space)
+    space_index = SpaceIndex(volume_space)
+    package_coordinates = []
+    if not place_sequence(package_list, orientations, 0, volume_space, space_index, package_coordinates):
+        return OPT_UNSUCCESSFUL
+    score = scorer.score(volume_space, space_index=space_index)
+    best = (score, list(package_coordinates))
+    while time.time() < end_time:
+        # Geometric cooling over the time available
+        progress = (time.time() - begin_time) / (end_time - begin_time)
+        temperature = temperatures[0] * (temperatures[1] / temperatures[0]) ** progress
+        new_list, new_orientations, start = mutate_solution(package_list, orientations, rng)
+        if place_sequence(new_list, new_orientations, start, volume_space, space_index, package_coordinates):
+            new_score = scorer.score(volume_space, space_index=space_index)
+            if new_score <= score or rng.uniform(0, 1) < np.exp((score - new_score) / temperature):
+                package_list, orientations, score = new_list, new_orientations, new_score
+                if score < best[0]:
+                    best = (score, list(package_coordinates))
                 continue
-        #print(f"package_counter {package_counter}")
-        # Increase counter to move to next package
-        package_counter += 1
-        # Once all packages have been placed
-        if package_counter == len(package_list):
-            # Score stacking
-            score = score_space(volume_space, article_list)
-            # Return
-            if queue is not None:
-                queue.put((score, attempts_counter, volume_space, package_coordinates))
-            return score, attempts_counter, volume_space, package_coordinates
+        # Rejected, go back to the current solution
+        place_sequence(package_list, orientations, start, volume_space, space_index, package_coordinates)
+    return best[0], [
+        [
+            article_list[package["article"]][0],
+            int(package["instance"]),
+            int(package["package"]),
+            *(int(i) for i in coordinates),
+        ]
+        for package, *coordinates in best[1]
+    ]
+
+
+"""
+Multi-resolution functions
+"""
+
+
+def coarsen_space(volume_space, cell_size):
+    """
+    Returns a coarse volume_space with cells of cell_size cm along each axis.
+    A coarse cell is only empty if all of its cells are empty, so placements stay valid at full resolution.
+    """
+    coarse = downsample_space(binarize_space(volume_space), cell_size)
+    return np.where(coarse, VOL_EMPTY, VOL_UNAVAILABLE).astype(VOL_DTYPE)
+
+
+def coarsen_article_list(article_list, cell_size):
+    """
+    Returns article_list with package dimensions rounded up to whole cells of cell_size cm.
+    """
+    return [
+        [
+            article[0],
+            article[1],
+            [
+                tuple(package[:1])
+                + tuple(-(-int(dimension) // cell_size) for dimension in package[1:4])
+                + tuple(package[4:])
+                for package in article[2]
+            ],
+        ]
+        for article in article_list
+    ]
+
+
+def refine_coordinates(package_coordinates, article_list, volume_space, cell_size):
+    """
+    Maps package coordinates found on a coarse grid back to full resolution.
+    Each package gets its actual dimensions in the orientation chosen on the coarse grid,
+    then packages are slid (in placement order) towards the origin to close gaps left by rounding.
+    Returns refined package coordinates.
+    """
+    # Actual package dimensions by article code and package ID
+    dimensions = {
+        (article[0], package[0]): sorted(int(dimension) for dimension in package[1:4])
+        for article in article_list
+        for package in article[2]
+    }
+    boxes = []
+    for coordinates in package_coordinates:
+        start = [int(i) * cell_size for i in coordinates[3:6]]
+        extents = [int(e) - int(s) + 1 for s, e in zip(coordinates[3:6], coordinates[6:9])]
+        # Rounding up is monotonic, so sorted dimensions map onto sorted coarse extents
+        package_dimensions = [0, 0, 0]
+        for axis, dimension in zip(np.argsort(extents, kind="stable"), dimensions[(coordinates[0], coordinates[2])]):
+            package_dimensions[axis] = dimension
+        boxes.append(start + package_dimensions)
+    # Occupy all boxes first, then slide them one by one
+    space_index = SpaceIndex(volume_space)
+    for box in boxes:
+        space_index.occupy_box(*box)
+    refined = []
+    for coordinates, box in zip(package_coordinates, boxes):
+        x, y, z = space_index.slide_box(*box)
+        package_x, package_y, package_z = box[3:]
+        refined.append(
+            list(coordinates[:3])
+            + [x, y, z, x + package_x - 1, y + package_y - 1, z + package_z - 1]
+        )
+    return refined
+
+
+"""
+Worker pool functions
+"""
+
+# Worker pool shared by all requests, created on first use
+_WORKER_POOL = None
+
+
+def get_worker_pool(processes=OPT_WORKER_COUNT):
+    """
+    Returns the long-lived worker pool, creating it if needed.
+    Concurrency is capped at the number of worker processes.
+    """
+    global _WORKER_POOL
+    if _WORKER_POOL is None:
+        # Start resource tracker first so workers inherit it for shared memory blocks
+        resource_tracker.ensure_running()
+        _WORKER_POOL = multiprocessing.Pool(processes=processes)
+    return _WORKER_POOL
+
+
+def shutdown_worker_pool():
+    """
+    Terminates the worker pool, e.g. when the server shuts down.
+    """
+    global _WORKER_POOL
+    if _WORKER_POOL is not None:
+        _WORKER_POOL.terminate()
+        _WORKER_POOL.join()
+        _WORKER_POOL = None
+
+
+class SharedCancelFlag:
+    """
+    Cancellation flag kept in a single byte of a shared memory block.
+    Behaves like a multiprocessing.Event for is_set() and set().
+    """
+
+    def __init__(self, shared_block, offset):
+        self.shared_block = shared_block
+        self.offset = offset
+
+    def is_set(self):
+        return self.shared_block.buf[self.offset] != 0
+
+    def set(self):
+        self.shared_block.buf[self.offset] = 1
+
+
+def share_space(volume_space):
+    """
+    Copies volume_space into a new shared memory block workers can read from.
+    One extra byte at the end of the block serves as cancellation flag.
+    Returns the shared memory block, its cancellation flag and a handle (name, shape, dtype) to pass to workers.
+    The caller is responsible for closing and unlinking the block.
+    """
+    shared_block = shared_memory.SharedMemory(create=True, size=volume_space.nbytes + 1)
+    shared_space = np.ndarray(volume_space.shape, dtype=volume_space.dtype, buffer=shared_block.buf)
+    shared_space[:] = volume_space
+    cancel_flag = SharedCancelFlag(shared_block, volume_space.nbytes)
+    return shared_block, cancel_flag, (shared_block.name, volume_space.shape, volume_space.dtype.str)
+
+
+def attach_shared_space(space_handle, copy_space=True):
+    """
+    Attaches to a volume_space held in shared memory.
+    Returns the shared memory block (to be closed by the caller), a private copy
+    of the volume_space (None if copy_space is False) and the block's cancellation flag.
+    """
+    name, shape, dtype = space_handle
+    try:
+        # Only the parent owns the block, so workers must not track it
+        shared_block = shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13 always tracks, which is fine as long as workers share the parent's tracker
+        shared_block = shared_memory.SharedMemory(name=name)
+    volume_space = np.ndarray(shape, dtype=dtype, buffer=shared_block.buf)
+    cancel_flag = SharedCancelFlag(shared_block, volume_space.nbytes)
+    return shared_block, np.array(volume_space) if copy_space else None, cancel_flag
+
+
+def run_optimizer_task(task):
+    """
+    Runs a single optimizer task in a pool worker.
+    The empty space is read from shared memory, and only the score, attempts
+    and package coordinates are sent back - the filled space can be rebuilt from them.
+    """
+    (
+        package_list,
+        article_list,
+        space_handle,
+        max_attempts,
+        biased,
+        bias_tendency,
+        deadline,
+        backtrack_depth,
+        placement_rule,
+        seed_sequence,
+        scorer,
+    ) = task
+    # Skip tasks that are no longer needed
+    if is_cancelled(deadline):
+        return OPT_UNSUCCESSFUL
+    try:
+        shared_block, empty_space, cancel_flag = attach_shared_space(space_handle)
+    except FileNotFoundError:
+        # Request has finished already and released its shared memory
+        return OPT_UNSUCCESSFUL
+    try:
+        response = optimizer(
+            package_list,
+            article_list,
+            np.copy(empty_space),
+            empty_space,
+            max_attempts=max_attempts,
+            biased=biased,
+            bias_tendency=bias_tendency,
+            deadline=deadline,
+            cancel_event=cancel_flag,
+            backtrack_depth=backtrack_depth,
+            placement_rule=placement_rule,
+            rng=np.random.default_rng(seed_sequence),
+            scorer=scorer,
+        )
+    finally:
+        shared_block.close()
+    if response in ERRORS_OPTIMIZER:
+        return response
+    score, attempts_counter, _, package_coordinates = response
+    return score, attempts_counter, package_coordinates
+
+
+def run_improvement_task(task):
+    """
+    Runs a single improvement task in a pool worker, see improve_solution.
+    """
+    package_list, orientations, article_list, volume_space, time_limit, deadline, seed_sequence, scorer = task
+    return improve_solution(
+        package_list,
+        orientations,
+        article_list,
+        volume_space,
+        time_limit,
+        rng=np.random.default_rng(seed_sequence),
+        scorer=scorer,
+        deadline=deadline,
+    )
+
+
+def generate_improvement(
+    package_coordinates, article_list, volume_space, time_limit, worker_pool, seed_sequence, worker_count=OPT_WORKER_COUNT
+):
+    """
+    Improves a stacking in parallel, with one annealing run for each of the worker_count workers
+    of worker_pool, all starting from the same solution. All runs stop time_limit seconds from now, so runs that have to wait
+    for a busy worker get less time rather than delaying the result.
+    Returns the package coordinates of the best stacking, which may be the original one.
+    """
+    deadline = time.time() + time_limit
+    scorer = SpaceScorer(article_list, volume_space)
+    package_list, orientations = get_solution(package_coordinates, article_list)
+    return_vals = [(scorer.score(fill_space(np.copy(volume_space), package_coordinates)), package_coordinates)]
+    tasks = [
+        (package_list, orientations, article_list, volume_space, time_limit, deadline, task_seed, scorer)
+        for task_seed in seed_sequence.spawn(worker_count or 1)
+    ]
+    for response in worker_pool.imap_unordered(run_improvement_task, tasks):
+        if response not in ERRORS_OPTIMIZER:
+            return_vals.append(response)
+    print(f"Improved scores: {[return_val[0] for return_val in return_vals]}")
+    return min(return_vals, key=lambda return_val: (return_val[0], return_val[1]))[1]
 
 
 def generate_optimizer(
@@ -550,69 +1717,273 @@ def generate_optimizer(
     generator_sorters=GEN_SORTERS,
     generator_random_lists=RANDOM_LIST_COUNT,
     optimizer_max_attempts=OPT_MAX_ATTEMPTS,
-    bias_options=BIAS_STACKS
+    bias_options=BIAS_STACKS,
+    worker_pool=None,
+    worker_count=OPT_WORKER_COUNT,
+    time_budget=OPT_TIME_BUDGET,
+    target_score=OPT_TARGET_SCORE,
+    optimizer_backtrack_depth=OPT_BACKTRACK_DEPTH,
+    placement_rules=OPT_PLACEMENT_RULES,
+    seed=OPT_SEED,
+    result_cache=None,
+    resolution=OPT_RESOLUTION,
+    engine=OPT_ENGINE,
+    improve_time=OPT_IMPROVE_TIME,
+    trunk_profile=None,
+    trunk_boxes=None,
 ):
     """
     Main function to run this module.
-    First checks if packages can fit at all, then generates various package lists.
-    Runs optimizers in parallel on each list.
+    First checks if packages can fit at all, using a cached profile of the trunk,
+    then generates various package lists.
+    Runs optimizers in parallel on each list, using the shared worker pool unless worker_pool is given.
     Finds lowest achieved score.
+    With resolution > 1, packages are first placed on a coarse grid with dimensions rounded up,
+    then refined at full resolution. If the coarse grid is too tight, full resolution is used instead.
+    Results are cached by trunk, package dimensions and settings, so repeated requests return immediately.
+    Every task draws from its own random stream derived from seed, so runs with the same seed are reproducible.
+    With engine "geometry", tasks place packages as boxes against a box description of the trunk
+    (trunk_boxes as returned by get_trunk_shape, or derived from volume_space),
+    and only the winning stacking is filled into volume_space.
+    With improve_time, the best stacking is then improved by simulated annealing on every worker
+    (worker_count of them, which should match the size of worker_pool if one is given),
+    within the time budget if there is one. Annealing stops on time, so seeded runs may then differ.
+    If time_budget (in seconds) runs out, or a solution reaches target_score, the best solution
+    found so far is returned and remaining work is cancelled.
     Returns filled volume_space and package coordinates.
     """
     begin_time = time.time()
-    # Check if package volume is smaller than or equal to available space, otherwise return error
-    if not is_space_sufficient(article_list, volume_space):
-        return INSUFFICIENT_SPACE
-    #print("Space sufficient")
-    # Check if longest package dimension is smaller than or equal to longest space dimension, otherwise return error
-    if not is_longest_dimension_sufficient(article_list, volume_space):
-        return INSUFFICIENT_DIMENSION
-    #print("Dimension sufficient")
-    # Generate list of package lists
-    package_lists = generate_package_lists(
-        article_list, sorters=generator_sorters, random_lists=generator_random_lists
+    # Work on compact labels, regardless of how the space was created
+    volume_space = np.asarray(volume_space, dtype=VOL_DTYPE)
+    # Reject packages that cannot fit before doing any work
+    if trunk_profile is None:
+        trunk_profile = get_trunk_profile(volume_space)
+    feasibility = check_trunk_profile(article_list, trunk_profile)
+    if feasibility is not None:
+        return feasibility
+    # Settings passed on when solving at another resolution
+    settings = dict(
+        generator_sorters=generator_sorters,
+        generator_random_lists=generator_random_lists,
+        optimizer_max_attempts=optimizer_max_attempts,
+        bias_options=bias_options,
+        worker_pool=worker_pool,
+        worker_count=worker_count,
+        target_score=target_score,
+        optimizer_backtrack_depth=optimizer_backtrack_depth,
+        placement_rules=placement_rules,
+        seed=seed,
+        result_cache=result_cache,
+        engine=engine,
+        improve_time=improve_time,
+    )
+    # Solve on a coarse grid first, then refine at full resolution
+    if resolution > 1:
+        coarse_return = generate_optimizer(
+            coarsen_article_list(article_list, resolution),
+            coarsen_space(volume_space, resolution),
+            time_budget=time_budget,
+            resolution=1,
+            **settings,
+        )
+        if coarse_return not in ERRORS_OPTIMIZER:
+            package_coordinates = refine_coordinates(
+                coarse_return[1], article_list, volume_space, resolution
+            )
+            print(f"Total multi-resolution optimizer time: {time.time()-begin_time}")
+            return fill_space(np.copy(volume_space), package_coordinates), package_coordinates
+        if coarse_return == OPT_TIME_BUDGET_EXCEEDED:
+            return coarse_return
+        # Rounding up lost too much space, try again at full resolution with the remaining time
+        if time_budget is not None:
+            time_budget = max(time_budget - (time.time() - begin_time), 0)
+        return generate_optimizer(
+            article_list,
+            volume_space,
+            time_budget=time_budget,
+            resolution=1,
+            trunk_profile=trunk_profile,
+            trunk_boxes=trunk_boxes,
+            **settings,
+        )
+    # Return cached result for identical trunk, packages and settings if available
+    if result_cache is None:
+        result_cache = get_result_cache()
+    if result_cache:
+        cache_key = make_optimizer_cache_key(article_list, volume_space, time_budget, settings)
+        package_coordinates = result_cache.get(cache_key, article_list)
+        if package_coordinates is not None:
+            print(f"Cached result returned in {time.time()-begin_time}")
+            return fill_space(np.copy(volume_space), package_coordinates), package_coordinates
+    # Independent random streams for package lists and each optimizer task
+    seed_sequence = np.random.SeedSequence(seed)
+    # Workers stop early once the deadline has passed or the cancellation flag is set
+    deadline = None if time_budget is None else begin_time + time_budget
+    shared_block, cancel_flag, task_function, tasks = start_optimizer_tasks(
+        article_list,
+        volume_space,
+        deadline,
+        seed_sequence,
+        generator_sorters=generator_sorters,
+        generator_random_lists=generator_random_lists,
+        optimizer_max_attempts=optimizer_max_attempts,
+        bias_options=bias_options,
+        optimizer_backtrack_depth=optimizer_backtrack_depth,
+        placement_rules=placement_rules,
+        engine=engine,
+        trunk_boxes=trunk_boxes,
     )
-    #print("Package lists generated")
-    # Set up threads
-    threads = []
-    queue = multiprocessing.Queue()
     # Set up an empty list
     return_vals = []
-    # Also copy the volume_space once, so that each optimizer thread has a point it can start from again if needed
-    empty_space = np.copy(volume_space)
-    # Call optimizer function for each package list
-    for package_list in package_lists:
-        # Set up new threads
-        # One for each defined bias in params.py
-        for bias in bias_options:
-            optimizer_thread = multiprocessing.Process(
-                target=optimizer,
-                args=(
-                    package_list,
-                    article_list,
-                    np.copy(volume_space),
-                    empty_space,
-                    queue,
-                    optimizer_max_attempts,
-                    bias[0],
-                    bias[1],
-                ),
-            )
-            # Append to thread list
-            threads.append(optimizer_thread)
-            # Start thread
-            optimizer_thread.start()
-    # Receive return values back for each thread
-    for thread in threads:
-        response = queue.get()
-        if response not in ERRORS_OPTIMIZER:
-            return_vals.append(response)
+    # Submit tasks to the worker pool and receive return values as they complete
+    if worker_pool is None:
+        worker_pool = get_worker_pool()
+    responses = worker_pool.imap_unordered(task_function, tasks)
+    try:
+        while True:
+            try:
+                timeout = None if deadline is None else max(deadline - time.time(), 0)
+                response = responses.next(timeout)
+            except (StopIteration, multiprocessing.TimeoutError):
+                # All tasks done or time budget used up
+                break
+            if response not in ERRORS_OPTIMIZER:
+                return_vals.append(response)
+                # Good enough, no need to wait for the rest
+                if target_score is not None and response[0] <= target_score:
+                    break
+    finally:
+        # Cancel remaining work
+        cancel_flag.set()
+        shared_block.close()
+        shared_block.unlink()
+    optimizer_return = finish_optimizer(
+        return_vals, article_list, volume_space, deadline, improve_time, worker_pool, seed_sequence, worker_count
+    )
+    if optimizer_return not in ERRORS_OPTIMIZER and result_cache:
+        result_cache.put(cache_key, optimizer_return[1])
+    print(f"Total optimizer time: {time.time()-begin_time}")
+    # Return
+    return optimizer_return
+
+
+def make_optimizer_cache_key(article_list, volume_space, time_budget, settings):
+    """
+    Returns the result cache key of a request, given the settings passed on by generate_optimizer.
+    """
+    return make_cache_key(
+        article_list,
+        volume_space,
+        {
+            "sorters": sorted(settings["generator_sorters"]),
+            "random_lists": settings["generator_random_lists"],
+            "max_attempts": settings["optimizer_max_attempts"],
+            "bias_options": settings["bias_options"],
+            "time_budget": time_budget,
+            "target_score": settings["target_score"],
+            "backtrack_depth": settings["optimizer_backtrack_depth"],
+            "placement_rules": settings["placement_rules"],
+            "seed": settings["seed"],
+            "engine": settings["engine"],
+            "improve_time": settings["improve_time"],
+        },
+    )
+
+
+def start_optimizer_tasks(
+    article_list,
+    volume_space,
+    deadline,
+    seed_sequence,
+    generator_sorters=GEN_SORTERS,
+    generator_random_lists=RANDOM_LIST_COUNT,
+    optimizer_max_attempts=OPT_MAX_ATTEMPTS,
+    bias_options=BIAS_STACKS,
+    optimizer_backtrack_depth=OPT_BACKTRACK_DEPTH,
+    placement_rules=OPT_PLACEMENT_RULES,
+    engine=OPT_ENGINE,
+    trunk_boxes=None,
+):
+    """
+    Shares volume_space with the workers and sets up one task for each package list
+    and each bias (or placement rule), with the settings of generate_optimizer.
+    The geometry engine only shares the cancellation flag, as its workers get the trunk as boxes.
+    Package lists are generated lazily, while the worker pool takes on tasks.
+    Returns the shared memory block, its cancellation flag, the function to run each task with
+    and the tasks. The caller is responsible for setting the flag, closing and unlinking the block.
+    """
+    # Package lists are generated lazily, while the worker pool takes on tasks
+    package_lists = iter_package_lists(
+        article_list,
+        sorters=generator_sorters,
+        random_lists=generator_random_lists,
+        rng=np.random.default_rng(seed_sequence.spawn(1)[0]),
+    )
+    # One task for each package list and each defined bias in params.py,
+    # or each placement rule if all orientations are to be evaluated
+    if placement_rules is None:
+        variants = [(bias[0], bias[1], None) for bias in bias_options]
+    else:
+        variants = [(False, 0, placement_rule) for placement_rule in placement_rules]
+    if engine == "geometry":
+        # Imported here, as the geometry engine builds on this module
+        from willitfit.optimizers.geometryoptimizer import find_unavailable_boxes, run_geometry_task
+
+        # Workers only need the trunk as boxes, so the shared block only carries the cancellation flag
+        if trunk_boxes is None:
+            trunk_boxes = find_unavailable_boxes(volume_space)
+        shared_block, cancel_flag, space_handle = share_space(np.empty(0, dtype=VOL_DTYPE))
+        space_handle = (space_handle, volume_space.shape, trunk_boxes)
+        task_function, scorer = run_geometry_task, None
+    else:
+        # Share the empty volume_space once, so that each optimizer task has a point it can start from
+        shared_block, cancel_flag, space_handle = share_space(volume_space)
+        # Scoring constants are the same for every task
+        task_function, scorer = run_optimizer_task, SpaceScorer(article_list, volume_space)
+    tasks = (
+        (
+            package_list,
+            article_list,
+            space_handle,
+            optimizer_max_attempts,
+            biased,
+            bias_tendency,
+            deadline,
+            optimizer_backtrack_depth,
+            placement_rule,
+            seed_sequence.spawn(1)[0],
+            scorer,
+        )
+        for package_list in package_lists
+        for biased, bias_tendency, placement_rule in variants
+    )
+    return shared_block, cancel_flag, task_function, tasks
+
+
+def finish_optimizer(
+    return_vals, article_list, volume_space, deadline, improve_time, worker_pool, seed_sequence, worker_count=OPT_WORKER_COUNT
+):
+    """
+    Picks the best of the optimizer results in return_vals and improves it with the time left,
+    on worker_count workers of worker_pool.
+    Returns filled volume_space and package coordinates, or an error code if there is no result.
+    """
     # Find lowest score
     scores = [return_val[0] for return_val in return_vals]
     print(f"Scores: {scores}")
     if len(scores) == 0:
+        if deadline is not None and time.time() >= deadline:
+            return OPT_TIME_BUDGET_EXCEEDED
         return OPT_UNSUCCESSFUL
-    score_index = scores.index(min(scores))
-    print(f"Total optimizer time: {time.time()-begin_time}")
-    # Return
-    return return_vals[score_index][2:]
+    # Results arrive in any order, so break ties by coordinates to stay reproducible
+    best_val = min(return_vals, key=lambda return_val: (return_val[0], return_val[2]))
+    package_coordinates = best_val[2]
+    # Keep improving the winning stacking with the time left
+    if improve_time is not None and deadline is not None:
+        improve_time = min(improve_time, deadline - time.time())
+    if improve_time is not None and improve_time > 0:
+        package_coordinates = generate_improvement(
+            package_coordinates, article_list, volume_space, improve_time, worker_pool, seed_sequence, worker_count
+        )
+    # Rebuild winning filled space from its package coordinates
+    return fill_space(np.copy(volume_space), package_coordinates), package_coordinates
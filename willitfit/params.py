@@ -87,12 +87,69 @@ VOL_UNAVAILABLE = -1
 VOL_BORDER = 1
 VOL_INTERIOR = -2
 VOL_EMPTY = 0
+# Labels above fit in a single byte
+VOL_DTYPE = "int8"
 
 # Optimizer settings
 BIAS_STACKS = [(False, 0), (True, 0.8), (True, 1)]
 RANDOM_LIST_COUNT = 3
+# Keep packages with identical dimensions together, so random lists only reorder distinct groups
+OPT_GROUP_PACKAGES = True
+# Smallest number of consecutive identical packages placed together as a layer or wall (0 to disable)
+OPT_LAYER_MIN_PACKAGES = 4
+# Seconds spent improving the best stacking by simulated annealing (None to skip)
+OPT_IMPROVE_TIME = None
+# Annealing temperature at the start and end of the improvement stage, in score units
+OPT_IMPROVE_TEMPERATURES = (0.1, 0.001)
 OPT_MAX_ATTEMPTS = 10
+# Number of placements undone before retrying (0 always restarts from scratch)
+OPT_BACKTRACK_DEPTH = 3
+# Placement rules for choosing between positions when all orientations of a package are evaluated.
+# Axes (0 = x/depth, 1 = y/width, 2 = z/height) are compared in the given order, lowest first.
+PLACEMENT_RULES = {
+    "lowest_z": (2, 0, 1),
+    "deepest_x": (0, 2, 1),
+    "leftmost_y": (1, 2, 0),
+}
+# Rule used when packages are placed one orientation at a time
+OPT_PLACEMENT_RULE = "lowest_z"
+# Rules to run for each package list with all orientations evaluated (None for random orientations)
+OPT_PLACEMENT_RULES = None
+# Seed for reproducible optimizer runs (None for fresh randomness on every run)
+OPT_SEED = None
+# Cell size in cm of the coarse grid packages are placed on before refining (1 for full resolution only)
+OPT_RESOLUTION = 1
+# Placement engine: "voxel" works on the volume_space grid, "geometry" on lists of boxes
+OPT_ENGINE = "voxel"
+# Parametric trunk shapes by generic_config, with all sizes as fractions of trunk dimensions.
+# The trunk-door slope starts at ratio_height of the height at the rear and rises by slant cm per cm
+# towards the front. Wheel arches (x_start, x_end, width, height) are placed on both sides,
+# floor steps (x_start, x_end, height) span the full width.
+TRUNK_PROFILES = {
+    "BOXY": {"ratio_height": 0.7, "slant": 4, "wheel_arches": [], "floor_steps": []},
+    "SLANT": {"ratio_height": 0.5, "slant": 2, "wheel_arches": [], "floor_steps": []},
+}
+# Profile used for configs without their own entry
+TRUNK_DEFAULT_PROFILE = "SLANT"
+# Optional folder to persist trunk templates to as .npy files, memory-mapped when loaded
+TRUNK_CACHE_FOLDER = None
+# Number of trunk templates kept in memory
+TRUNK_TEMPLATE_CACHE_SIZE = 32
+# Number of trunk profiles (used for fast feasibility checks) kept in memory
+TRUNK_PROFILE_CACHE_SIZE = 64
+# Number of optimizer results kept in memory, and optional folder to persist them to (relative to the package)
+RESULT_CACHE_SIZE = 256
+RESULT_CACHE_FOLDER = None
+# Pre-defined package lists as "sorter|direction", sorters are registered in optimizers/volumeoptimizer.py:
+# volume, longest_edge, footprint, height, weight, density
+# Every sorter adds a package list to each request on top of the random lists in OPTIMIZER_OPTIONS
 GEN_SORTERS = ["volume|descending"]
+# Size of the long-lived optimizer worker pool
+OPT_WORKER_COUNT = os.cpu_count()
+# Seconds after which the best solution so far is returned (None for no limit)
+OPT_TIME_BUDGET = None
+# Score at which a solution is accepted without waiting for the rest (None to always wait)
+OPT_TARGET_SCORE = None
 OPTIMIZER_OPTIONS = {
     "Efficient" : ["Very fast, but may miss more optimal results.", ["Rigid", "Rigid"], 0, 1],
     "Standard" : ["Usually the most appropriate setting for most users. Provides a balance between speed and performance.", ["Rigid", "Biased"], 3, 5],
@@ -126,13 +183,18 @@ OPT_INSUFFICIENT_SPACE = (
     "Optimizer could not place this package (internal return code)."
 )
 OPT_UNSUCCESSFUL = "Optimizer was unable to place all packages."
+OPT_TIME_BUDGET_EXCEEDED = "Optimizer ran out of time before placing all packages."
 ERRORS_OPTIMIZER = [
     INSUFFICIENT_SPACE,
     INSUFFICIENT_DIMENSION,
     OPT_INSUFFICIENT_SPACE,
     OPT_UNSUCCESSFUL,
+    OPT_TIME_BUDGET_EXCEEDED,
 ]
 
+# Batch optimizer
+CAR_MODEL_NOT_FOUND = "Car model could not be found."
+
 # Scraper
 WEBSITE_UNAVAILABLE = "Website temporarily unavailable."
 ARTICLE_NOT_FOUND = "One or more articles could not be found."
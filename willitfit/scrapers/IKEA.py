@@ -25,7 +25,7 @@ from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.common.by import By
 from webdriver_manager.chrome import ChromeDriverManager
 from willitfit.app_utils.googlecloud import get_cloud_data, send_cloud_data
-from willitfit.app_utils.utils import get_local_data
+from willitfit.app_utils.utils import get_local_data, df_to_list
 
 import os
 import requests
@@ -223,51 +223,6 @@ def packages_dimensions_weight_to_df(unique_dimensions_list , number, product_na
 
 
 
-def df_to_list(df, article_code):
-    """
-    Prepare output for API from data frame.
-    [(
-    article_code (str),
-    item_count (int),
-        [(
-        package_id (int),
-        package_length (int),
-        package_width (int),
-        package_height (int),
-        package_weight (float)
-        )]
-    )]
-    """
-    # Initialize empty list
-    return_list = []
-
-    # Loop over each article
-    for article, article_count in article_code.items():
-        # Sub-list when there are multiple packages
-        package_list = []
-        # Find all matches in dataframe
-        matched_packages = df[df["article_code"] == article]
-        # Loop over all packages
-        package_count = 1
-        for _, matched_package in matched_packages.iterrows():
-            # If the same package exists multiple times this will run more than once
-            for idx in range(int(matched_package["packages"])):
-                package_list.append(
-                    (
-                        package_count,
-                        int(matched_package["height"]),
-                        int(matched_package["width"]),
-                        int(matched_package["length"]),
-                        matched_package["weight"],
-                    )
-                )
-                # Append package ID, dimensions and weight
-                package_count += 1
-        # Append list of packages
-        return_list.append([article, article_count, package_list])
-    return return_list
-
-
 def product_info_and_update_csv_database(
     article_dict, db, path_to_csv=DATABASE_PATH, item_count=1, lang_code="de1"
 ):